@@ -5,3 +5,13 @@ class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
     verbose_name = 'Foodgram'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+
+        from . import performance, signals  # noqa: F401
+        if (settings.SERVER_TIMING_SAMPLE_RATE > 0
+                or settings.METRICS_ENABLED):
+            connection_created.connect(performance.install_query_recorder)
+            performance.instrument_serializers()
@@ -0,0 +1,42 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from django.conf import settings
+from django.db import close_old_connections
+
+# Синхронный код (ORM, сериализаторы) async-view выполняется здесь:
+# число потоков ограничивает и число соединений воркера с БД
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='orm')
+
+
+def call_in_thread(func, *args, **kwargs):
+    """Как request_started/request_finished для соединений потока пула."""
+    close_old_connections()
+    try:
+        response = func(*args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()  # Рендер тоже не в цикле событий
+        return response
+    finally:
+        close_old_connections()
+
+
+async def run_in_pool(func, *args, **kwargs):
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, partial(context.run, call_in_thread, func, *args, **kwargs))
+
+
+def async_view(view):
+    """
+    Async-обёртка над DRF-view. Под ASGI Django 3.2 выполняет все
+    синхронные view процесса в одном потоке, а обёрнутые выполняются
+    параллельно в пуле, не блокируя цикл событий.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run_in_pool(view, request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,60 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import metrics
+from .models import User
+
+# Поля снимка меняются только через save(), который сбрасывает снимок.
+# Остальные (счётчики, shopping_cart_changed) Django дочитает при обращении
+SNAPSHOT_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name',
+                   'avatar', 'is_active', 'is_staff', 'is_superuser')
+
+
+def token_cache_key(key):
+    return f'auth:token:{sha256(key.encode()).hexdigest()}'
+
+
+def invalidate_tokens(*keys):
+    """Сбрасываем снимки сразу и после коммита транзакции."""
+    cache_keys = [token_cache_key(key) for key in keys]
+    cache.delete_many(cache_keys)
+    transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса к БД: снимок пользователя хранится
+    в общем кэше по хэшу токена (AUTH_TOKEN_CACHE_TIMEOUT) и сбрасывается
+    при выходе, смене пароля и деактивации во всех воркерах сразу.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        values = cache.get(cache_key)
+        if values is None:
+            metrics.count_cache('auth_token', misses=1)
+            try:
+                user, token = super().authenticate_credentials(key)
+            except AuthenticationFailed:
+                metrics.inc('foodgram_auth_failures_total', reason='token')
+                raise
+            cache.set(cache_key, {
+                field.attname: field.get_prep_value(
+                    field.value_from_object(user))
+                for field in User._meta.concrete_fields
+                if field.attname in SNAPSHOT_FIELDS
+            }, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            return user, token
+        metrics.count_cache('auth_token', hits=1)
+        # Пароль и прочие поля не загружены: save() запишет только снимок.
+        # from_db ждёт значения в порядке полей модели
+        fields = [field.attname for field in User._meta.concrete_fields
+                  if field.attname in values]
+        user = User.from_db(
+            'default', fields, [values[field] for field in fields])
+        return user, self.get_model()(key=key, user=user)
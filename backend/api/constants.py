@@ -4,3 +4,17 @@ MEASUREMENT_UNIT_MAX_LENGTH = 64
 TAG_DATA_MAX_LENGTH = 32
 MIN_TIME_VALUE = 1
 MIN_AMOUNT_VALUE = 1
+SHOPPING_CART_CHUNK_SIZE = 500
+SHOPPING_CART_NAME_WIDTH = 35
+BULK_BATCH_SIZE = 500
+INGREDIENT_SEARCH_MIN_LENGTH = 3
+INGREDIENT_SEARCH_FUZZY_THRESHOLD = 0.6
+# Наибольшая сторона уменьшенных копий картинок, px
+RECIPE_IMAGE_VARIANTS = {'small': 320, 'medium': 960}
+AVATAR_IMAGE_VARIANTS = {'small': 160}
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024  # Байт после декодирования
+IMAGE_MAX_DIMENSION = 10000  # px по каждой стороне
+IMAGE_MAX_PIXELS = 24_000_000  # Площадь: ~100 МБ RGBA при обработке
+IMAGE_DECODE_CHUNK_SIZE = 64 * 1024  # Символов base64, кратно 4
+SHORT_CODE_LENGTH = 6  # Символов base62: хватает на 62**6 рецептов
@@ -0,0 +1,108 @@
+import base64
+import binascii
+from tempfile import SpooledTemporaryFile
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+from .constants import (IMAGE_DECODE_CHUNK_SIZE, IMAGE_MAX_DIMENSION,
+                        IMAGE_MAX_PIXELS, IMAGE_UPLOAD_MAX_SIZE)
+
+IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+class StreamingBase64ImageField(serializers.FileField):
+    """
+    Картинка в base64 (data URL). Строка декодируется частями во временный
+    файл, который держится в памяти только до FILE_UPLOAD_MAX_MEMORY_SIZE.
+    Размер, формат и размеры картинки проверяются до полного декодирования,
+    а целостность — Pillow по файлу, без копии в памяти.
+    """
+
+    default_error_messages = {
+        'invalid_base64': 'Загрузите корректную картинку в base64.',
+        'too_large': 'Размер картинки больше {max_size} байт.',
+        'invalid_format': 'Поддерживаются форматы: {formats}.',
+        'too_big_dimensions': 'Стороны картинки должны быть не больше '
+                              '{max_dimension} px.',
+        'too_many_pixels': 'В картинке должно быть не больше '
+                           '{max_pixels} пикселей.',
+    }
+
+    def to_internal_value(self, data):
+        if data == '':
+            return None  # Как у Base64ImageField: пустая строка — нет файла
+        if not isinstance(data, str):
+            self.fail('invalid_base64')
+        # Заголовок data URL отбрасываем смещением, не копируя строку
+        start = data.find(';base64,')
+        start = 0 if start == -1 else start + len(';base64,')
+        # С запасом на переносы строк (MIME, по 76 символов): точный размер
+        # проверяется при декодировании
+        if ((len(data) - start) // 4 * 3
+                > IMAGE_UPLOAD_MAX_SIZE + IMAGE_UPLOAD_MAX_SIZE // 38):
+            self.fail('too_large', max_size=IMAGE_UPLOAD_MAX_SIZE)
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        try:
+            extension = None
+            rest = ''  # Хвост части без пробелов, не кратный 4
+            for offset in range(start, len(data), IMAGE_DECODE_CHUNK_SIZE):
+                end = offset + IMAGE_DECODE_CHUNK_SIZE
+                chunk = rest + ''.join(data[offset:end].split())
+                if end < len(data):
+                    split = len(chunk) // 4 * 4
+                    chunk, rest = chunk[:split], chunk[split:]
+                try:
+                    file.write(base64.b64decode(chunk, validate=True))
+                except (binascii.Error, ValueError):
+                    self.fail('invalid_base64')
+                if file.tell() > IMAGE_UPLOAD_MAX_SIZE:
+                    self.fail('too_large', max_size=IMAGE_UPLOAD_MAX_SIZE)
+                if offset == start:
+                    extension = self.check_header(file)
+            if extension is None:  # Заголовок длиннее первой части
+                extension = self.check_header(file, complete=True)
+            self.verify(file)
+        except serializers.ValidationError:
+            file.close()
+            raise
+        size = file.seek(0, 2)
+        file.seek(0)
+        return super().to_internal_value(UploadedFile(
+            file, f'{uuid4()}.{extension}', size=size))
+
+    def check_header(self, file, complete=False):
+        """
+        Формат и размеры из заголовка: Pillow не декодирует пиксели.
+        None — заголовок прочитан не целиком, проверим после декодирования.
+        """
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                image_format, (width, height) = image.format, image.size
+        except Exception:
+            if not complete:
+                return None
+            self.fail('invalid_format', formats=', '.join(IMAGE_FORMATS))
+        finally:
+            file.seek(0, 2)
+        if image_format not in IMAGE_FORMATS:
+            self.fail('invalid_format', formats=', '.join(IMAGE_FORMATS))
+        if max(width, height) > IMAGE_MAX_DIMENSION:
+            self.fail('too_big_dimensions',
+                      max_dimension=IMAGE_MAX_DIMENSION)
+        if width * height > IMAGE_MAX_PIXELS:  # Декомпрессионная бомба
+            self.fail('too_many_pixels', max_pixels=IMAGE_MAX_PIXELS)
+        return IMAGE_FORMATS[image_format]
+
+    def verify(self, file):
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                image.verify()
+        except Exception:
+            self.fail('invalid_base64')
@@ -1,6 +1,8 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from .models import Ingredient, Recipe, Tag, User
+from .models import FavoriteRecipe, Ingredient, Recipe, ShoppingCart, Tag, User
+from .search import IngredientSearch
 
 
 class RecipesFilter(filters.FilterSet):
@@ -8,6 +10,7 @@ class RecipesFilter(filters.FilterSet):
         field_name='tags__slug',
         queryset=Tag.objects.all(),
         to_field_name='slug',
+        method='filter_tags',
     )
     author = filters.ModelChoiceFilter(
         queryset=User.objects.all(),
@@ -19,31 +22,43 @@ class RecipesFilter(filters.FilterSet):
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorite'
     )
+    ordering = filters.OrderingFilter(  # Сортировка ленты по популярности
+        fields=('pub_date', 'favorites_count', 'shopping_cart_count')
+    )
 
     class Meta:
         model = Recipe
         fields = ['tags', 'author', 'is_in_shopping_cart', 'is_favorited']
 
-    def filter_in_shopping_cart(self, queryset, name, value):
+    # Фильтры по связям — полусоединения EXISTS: без размножения строк,
+    # DISTINCT и NOT IN
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__in=value)))
+
+    def filter_user_relation(self, queryset, model, value):
         user = self.request.user
         if not user.is_authenticated:
             return queryset.none()
-        if value:
-            return queryset.filter(shoppingcart_items__user=user)
-        return queryset.exclude(shoppingcart_items__user=user)
+        exists = Exists(model.objects.filter(user=user, recipe=OuterRef('pk')))
+        return queryset.filter(exists if value else ~exists)
+
+    def filter_in_shopping_cart(self, queryset, name, value):
+        return self.filter_user_relation(queryset, ShoppingCart, value)
 
     def filter_is_favorite(self, queryset, name, value):
-        user = self.request.user
-        if not user.is_authenticated:
-            return queryset.none()
-        if value:
-            return queryset.filter(favoriterecipe_items__user=user)
-        return queryset.exclude(favoriterecipe_items__user=user)
+        return self.filter_user_relation(queryset, FavoriteRecipe, value)
 
 
 class IngredientSearchFilter(filters.FilterSet):
-    name = filters.CharFilter(field_name='name', lookup_expr='istartswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ['name']
+
+    def filter_name(self, queryset, name, value):
+        # Сначала совпадения по началу, затем по вхождению и похожие
+        return IngredientSearch.filter(queryset, value)
@@ -0,0 +1,101 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+from . import response_cache
+from .constants import (AVATAR_IMAGE_VARIANTS, IMAGE_VARIANT_QUALITY,
+                        RECIPE_IMAGE_VARIANTS)
+from .models import Recipe, User
+
+logger = logging.getLogger(__name__)
+
+# AVIF Pillow не пишет без плагина, WebP — если собран с libwebp
+VARIANT_FORMAT, VARIANT_SUFFIX = (
+    ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg'))
+
+# Модель -> (поле картинки, размеры копий, сброс кэша ответов)
+IMAGE_FIELDS = {
+    Recipe: ('image', RECIPE_IMAGE_VARIANTS,
+             lambda recipe: response_cache.invalidate_recipe(recipe)),
+    User: ('avatar', AVATAR_IMAGE_VARIANTS,
+           lambda user: response_cache.invalidate_author(user.pk)),
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_PROCESSING_WORKERS,
+    thread_name_prefix='images')
+
+
+def variant_name(name, variant):
+    path = PurePosixPath(name)
+    return str(path.parent / 'variants' / f'{path.stem}_{variant}.'
+               f'{VARIANT_SUFFIX}')
+
+
+def make_variants(field_file, sizes):
+    """Уменьшенные и пережатые копии картинки: {вариант: имя файла}."""
+    storage = field_file.storage
+    variants = {'source': field_file.name}
+    with storage.open(field_file.name) as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert(
+            'RGBA' if VARIANT_FORMAT == 'WEBP' and 'A' in image.getbands()
+            else 'RGB')
+        for variant, size in sizes.items():
+            copy = image.copy()
+            copy.thumbnail((size, size))
+            buffer = BytesIO()
+            copy.save(buffer, VARIANT_FORMAT, quality=IMAGE_VARIANT_QUALITY,
+                      optimize=True)
+            name = variant_name(field_file.name, variant)
+            storage.delete(name)
+            variants[variant] = storage.save(
+                name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def needs_variants(instance):
+    field, _, _ = IMAGE_FIELDS[type(instance)]
+    name = getattr(instance, field).name
+    variants = getattr(instance, f'{field}_variants')
+    return bool(name) and variants.get('source') != name
+
+
+def process(model, pk):
+    """Готовит копии, если картинка объекта не сменилась за это время."""
+    field, sizes, invalidate = IMAGE_FIELDS[model]
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not needs_variants(instance):
+        return
+    variants = make_variants(getattr(instance, field), sizes)
+    # update() не шлёт post_save, поэтому повторной обработки не будет
+    if model.objects.filter(pk=pk, **{field: variants['source']}).update(
+            **{f'{field}_variants': variants}):
+        invalidate(instance)
+
+
+def run(model, pk):
+    try:
+        process(model, pk)
+    except Exception:
+        logger.exception('Image processing failed for %s %s',
+                         model.__name__, pk)
+    finally:
+        connection.close()  # Соединение потока пула не переиспользуется
+
+
+def schedule(instance):
+    """После коммита отдаёт картинку объекта в обработку."""
+    if not needs_variants(instance):
+        return
+    model, pk = type(instance), instance.pk
+    if settings.IMAGE_PROCESSING_ASYNC:
+        transaction.on_commit(lambda: executor.submit(run, model, pk))
+    else:
+        transaction.on_commit(lambda: process(model, pk))
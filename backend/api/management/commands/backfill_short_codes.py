@@ -0,0 +1,29 @@
+from api.constants import BULK_BATCH_SIZE
+from api.models import Recipe
+from api.short_links import encode
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Assign short link codes to recipes that have none'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BULK_BATCH_SIZE,
+            help='Recipes updated per bulk query')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            # Обработанные рецепты выпадают из выборки
+            recipes = [
+                Recipe(pk=pk, short_code=encode(pk))
+                for pk in Recipe.objects.filter(
+                    short_code__isnull=True).order_by('pk').values_list(
+                    'pk', flat=True)[:options['batch_size']]]
+            if not recipes:
+                break
+            Recipe.objects.bulk_update(recipes, ('short_code',))
+            total += len(recipes)
+        self.stdout.write(self.style.SUCCESS(
+            f'Assigned short codes to {total} recipes'))
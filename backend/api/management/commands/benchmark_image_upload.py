@@ -0,0 +1,62 @@
+import base64
+import multiprocessing
+import os
+import resource
+from io import BytesIO
+
+from api.fields import StreamingBase64ImageField
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from PIL import Image
+from rest_framework import serializers
+
+
+def decode_in_memory(data):
+    """Как прежний Base64ImageField: вся строка декодируется в байты."""
+    header, data = data.split(';base64,')
+    return serializers.ImageField().to_internal_value(
+        SimpleUploadedFile('image.png', base64.b64decode(data)))
+
+
+def decode_streaming(data):
+    return StreamingBase64ImageField().to_internal_value(data)
+
+
+DECODERS = {'in-memory': decode_in_memory, 'streaming': decode_streaming}
+
+
+def measure(decoder, data, queue):
+    """Прирост пикового RSS процесса за одну загрузку, КБ."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    DECODERS[decoder](data)
+    queue.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+
+
+class Command(BaseCommand):
+    help = 'Measure peak RSS of decoding one base64 image upload'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--side', type=int, default=1500,
+            help='Side of the random noise PNG, px')
+
+    def handle(self, *args, **options):
+        side = options['side']
+        buffer = BytesIO()
+        Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(
+            buffer, 'PNG')
+        data = ('data:image/png;base64,'
+                + base64.b64encode(buffer.getvalue()).decode())
+        self.stdout.write(
+            f'Image {buffer.tell() / 2 ** 20:.1f} MB, '
+            f'payload {len(data) / 2 ** 20:.1f} MB')
+        # Каждый замер в отдельном процессе: пиковый RSS не сбрасывается
+        context = multiprocessing.get_context('fork')
+        for decoder in DECODERS:
+            queue = context.Queue()
+            process = context.Process(
+                target=measure, args=(decoder, data, queue))
+            process.start()
+            peak = queue.get()
+            process.join()
+            self.stdout.write(f'{decoder}: peak RSS +{peak / 1024:.1f} MB')
@@ -1,45 +1,142 @@
 import csv
+import json
+import re
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import response_cache
+from api.constants import BULK_BATCH_SIZE
 from api.models import Ingredient
-from django.core.management.base import BaseCommand
+from api.reference_cache import ingredients_cache
+
+JSON_CHUNK_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')  # Между объектами массива
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        yield row[0] if row else '', row[1] if len(row) > 1 else ''
+
+
+def iter_json(file):
+    """
+    Объекты JSON-массива по одному, не читая файл целиком. Буфер не
+    копируется на каждый объект: двигаем позицию, а обрезаем буфер
+    только при дочитывании.
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('JSON file must contain an array of objects.')
+    position = 1
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Unexpected end of JSON file.')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item.get('name', ''), item.get('measurement_unit', '')
+
+
+READERS = {'.csv': iter_csv, '.json': iter_json}
 
 
 class Command(BaseCommand):
-    help = 'Import ingredients from CSV file'
+    help = 'Import ingredients from CSV or JSON file'
 
     def add_arguments(self, parser):
-        parser.add_argument('csv_file', type=str)
-
-    def handle(self, *args, **kwargs):
-        csv_file = kwargs['csv_file']
-        # Открываем CSV файл и читаем его
-        with open(csv_file, newline='', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                if len(row) < 2:  # Проверяем, что в строке достаточно данных
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f'Error importing ingredient: '
-                            f'row does not contain enough data: {row}'
-                        )
-                    )
-                    continue
-                try:
-                    ingredient, created = Ingredient.objects.get_or_create(
-                        name=row[0].strip(),  # Убираем лишние пробелы
-                        defaults={'measurement_unit': row[1].strip()}
-                    )
-                    if created:
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f'Ingredient "{ingredient.name}" '
-                                f'imported successfully!'
-                            )
-                        )
-                    else:
-                        self.stdout.write(self.style.WARNING(
-                            f'Ingredient "{ingredient.name}" already exists.'))
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(
-                        f'Error importing ingredient "{row[0]}": {str(e)}'))
+        parser.add_argument('file', type=str)
+        parser.add_argument(
+            '--format', choices=('csv', 'json'),
+            help='File format (by default taken from the file extension)')
+        parser.add_argument(
+            '--batch-size', type=int, default=BULK_BATCH_SIZE,
+            help='Rows written per bulk query')
+        parser.add_argument(
+            '--update', action='store_true',
+            help='Update measurement units of existing ingredients')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be created or updated')
+
+    def handle(self, *args, **options):
+        path = Path(options['file'])
+        suffix = f".{options['format']}" if options['format'] else (
+            path.suffix.lower())
+        if suffix not in READERS:
+            raise CommandError(f'Unsupported file format: {path.name}')
+        self.options = options
+        self.stats = dict.fromkeys(
+            ('read', 'skipped', 'created', 'updated', 'unchanged'), 0)
+        with open(path, newline='', encoding='utf-8') as file, \
+                transaction.atomic():
+            rows = self.normalize(READERS[suffix](file))
+            while True:
+                chunk = dict(islice(rows, options['batch_size']))
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+        if not options['dry_run']:
+            # bulk-запросы не шлют сигналы
+            ingredients_cache.invalidate()
+            response_cache.invalidate(response_cache.REFERENCE)
         self.stdout.write(self.style.SUCCESS(
-            'All ingredients imported successfully!'))
+            ('Dry run: ' if options['dry_run'] else 'Import finished: ')
+            + ', '.join(f'{key} {value}' for key, value in self.stats.items())
+        ))
+
+    def normalize(self, rows):
+        """Приводим названия к виду из Ingredient.save()."""
+        for name, measurement_unit in rows:
+            self.stats['read'] += 1
+            name, measurement_unit = name.strip().lower(), (
+                measurement_unit.strip())
+            if not name or not measurement_unit:
+                self.stats['skipped'] += 1
+                self.stdout.write(self.style.ERROR(
+                    f'Skipped row {self.stats["read"]}: '
+                    f'name and measurement unit are required.'))
+                continue
+            yield name, measurement_unit
+
+    def import_chunk(self, chunk):
+        existing = {
+            name: (pk, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.filter(
+                name__in=chunk).values_list('id', 'name', 'measurement_unit')
+        }
+        new = [Ingredient(name=name, measurement_unit=measurement_unit)
+               for name, measurement_unit in chunk.items()
+               if name not in existing]
+        changed = [
+            Ingredient(pk=existing[name][0], name=name,
+                       measurement_unit=measurement_unit)
+            for name, measurement_unit in chunk.items()
+            if name in existing and existing[name][1] != measurement_unit
+        ]
+        if not self.options['update']:
+            changed = []
+        self.stats['created'] += len(new)
+        self.stats['updated'] += len(changed)
+        self.stats['unchanged'] += len(existing) - len(changed)
+        if self.options['verbosity'] > 1:
+            for ingredient in new:
+                self.stdout.write(f'+ {ingredient.name}')
+            for ingredient in changed:
+                self.stdout.write(
+                    f'~ {ingredient.name}: {existing[ingredient.name][1]} '
+                    f'-> {ingredient.measurement_unit}')
+        if self.options['dry_run']:
+            return
+        Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+        Ingredient.objects.bulk_update(changed, ('measurement_unit',))
@@ -0,0 +1,137 @@
+import os
+import socket
+import subprocess
+import time
+from http import HTTPStatus
+from http.client import HTTPConnection
+from statistics import quantiles
+from threading import Thread
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MODES = {'sync': 'False', 'async': 'True'}  # Значения ASYNC_VIEWS
+POOL = {'off': ('False',), 'on': ('True',), 'both': ('False', 'True')}
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('localhost', port), 1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'Server did not start on port {port}.')
+
+
+def client(port, urls, headers, deadline, latencies, failures):
+    """
+    Один клиент с keep-alive соединением: запросы подряд до deadline.
+    Время пишется только для ответов 2xx, для остальных — статус (None —
+    ошибка соединения).
+    """
+    connection = HTTPConnection('localhost', port, timeout=30)
+    number = 0
+    while time.monotonic() < deadline:
+        url = urls[number % len(urls)]
+        number += 1
+        started = time.monotonic()
+        try:
+            connection.request('GET', url, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except OSError:
+            failures.append(None)
+            connection.close()
+            continue
+        if 200 <= response.status < 300:
+            latencies.append(time.monotonic() - started)
+        else:
+            failures.append(response.status)
+    connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Compare throughput of sync (WSGI) and async (ASGI) gunicorn '
+            'workers, with and without the DB connection pool')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds per mode')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--url', action='append', dest='urls',
+                            help='Path to request (repeatable)')
+        parser.add_argument('--token', help='Token for authenticated URLs')
+        parser.add_argument('--mode', action='append', dest='modes',
+                            choices=MODES)
+        parser.add_argument('--pool', choices=POOL, default='off',
+                            help='Run with the DB connection pool (DB_POOL)')
+        parser.add_argument('--throttling', action='store_true',
+                            help='Keep request rate limits on; by default '
+                                 'the server runs with THROTTLING_ENABLED='
+                                 'False so the load does not hit 429')
+
+    def handle(self, *args, **options):
+        urls = [quote(url, safe='/?=&') for url in
+                options['urls'] or ('/api/recipes/', '/api/ingredients/')]
+        headers = ({'Authorization': f'Token {options["token"]}'}
+                   if options['token'] else {})
+        for mode in options['modes'] or MODES:
+            for pool in POOL[options['pool']]:
+                self.run_server(mode, pool, urls, headers, options)
+
+    def run_server(self, mode, pool, urls, headers, options):
+        server = subprocess.Popen(
+            ('gunicorn', '-c', 'gunicorn.conf.py',
+             '--bind', f'localhost:{options["port"]}',
+             '--workers', str(options['workers'])),
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'ASYNC_VIEWS': MODES[mode], 'DB_POOL': pool,
+                 'GUNICORN_WORKERS': str(options['workers']),
+                 'THROTTLING_ENABLED': str(options['throttling'])},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(options['port'])
+            self.report(f'{mode}, pool {"on" if pool == "True" else "off"}',
+                        self.run_load(urls, headers, options),
+                        options['duration'])
+        finally:
+            server.terminate()
+            server.wait()
+
+    def run_load(self, urls, headers, options):
+        latencies, failures = [], []
+        deadline = time.monotonic() + options['duration']
+        threads = [
+            Thread(target=client, args=(options['port'], urls, headers,
+                                        deadline, latencies, failures))
+            for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, failures
+
+    def report(self, mode, result, duration):
+        """Пропускная способность и перцентили — только по ответам 2xx."""
+        latencies, failures = result
+        throttled = failures.count(HTTPStatus.TOO_MANY_REQUESTS)
+        errors = len(failures) - throttled
+        if len(latencies) < 2:
+            raise CommandError(
+                f'{mode}: no successful requests '
+                f'({throttled} throttled, {errors} errors).')
+        percentiles = quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{mode}: {len(latencies) / duration:.1f} req/s (2xx), '
+            f'p50 {percentiles[49] * 1000:.1f} ms, '
+            f'p99 {percentiles[98] * 1000:.1f} ms, '
+            f'throttled (429) {throttled}, errors {errors}')
+        if failures:
+            self.stdout.write(self.style.WARNING(
+                f'{mode}: {len(failures)} of '
+                f'{len(failures) + len(latencies)} requests failed.'))
@@ -0,0 +1,27 @@
+from api.images import IMAGE_FIELDS, needs_variants, process
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Build missing image variants (e.g. after a worker restart)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild variants even if they are up to date')
+
+    def handle(self, *args, **options):
+        for model, (field, _, _) in IMAGE_FIELDS.items():
+            processed = 0
+            queryset = model.objects.exclude(
+                **{f'{field}__isnull': True}).exclude(**{field: ''})
+            for instance in queryset.iterator():
+                if options['force']:
+                    model.objects.filter(pk=instance.pk).update(
+                        **{f'{field}_variants': {}})
+                elif not needs_variants(instance):
+                    continue
+                process(model, instance.pk)
+                processed += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model.__name__}: processed {processed} images'))
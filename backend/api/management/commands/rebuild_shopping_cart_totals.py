@@ -0,0 +1,43 @@
+from api.models import ShoppingCartTotal
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify shopping cart totals against shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only compare stored totals with the live aggregate')
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            count = ShoppingCartTotal.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f'Shopping cart totals rebuilt: {count} rows.'))
+        live = {
+            (row['user_id'], row['ingredient_id']): row['amount']
+            for row in ShoppingCartTotal.objects.live().iterator()
+        }
+        stored = dict(
+            ((user_id, ingredient_id), amount)
+            for user_id, ingredient_id, amount in (
+                ShoppingCartTotal.objects.values_list(
+                    'user_id', 'ingredient_id', 'amount').iterator())
+        )
+        mismatches = [
+            (key, stored.get(key), live.get(key))
+            for key in stored.keys() | live.keys()
+            if stored.get(key) != live.get(key)
+        ]
+        for (user_id, ingredient_id), stored_amount, live_amount in (
+                mismatches):
+            self.stdout.write(self.style.WARNING(
+                f'User {user_id}, ingredient {ingredient_id}: '
+                f'stored {stored_amount}, live {live_amount}'))
+        if mismatches:
+            raise CommandError(
+                f'{len(mismatches)} shopping cart totals differ; '
+                f'run without --verify to rebuild.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Shopping cart totals match: {len(stored)} rows.'))
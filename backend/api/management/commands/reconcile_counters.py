@@ -0,0 +1,58 @@
+from api.constants import BULK_BATCH_SIZE
+from api.models import FavoriteRecipe, Recipe, ShoppingCart, Subscription, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (  # (модель, счётчик, связанная модель, внешний ключ)
+    (Recipe, 'favorites_count', FavoriteRecipe, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'author'),
+)
+
+
+def count_related(model, field):
+    """Подзапрос с числом связанных строк для каждой строки счётчика."""
+    return Coalesce(Subquery(
+        model.objects
+        .filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')), 0)
+
+
+class Command(BaseCommand):
+    help = 'Repair drift in denormalized recipe and user counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report counters that differ from the live count')
+
+    def handle(self, *args, **options):
+        drifted_total = 0
+        for model, field, related_model, related_field in COUNTERS:
+            drifted = [
+                model(pk=pk, **{field: actual})
+                for pk, actual in (
+                    model.objects
+                    .annotate(actual=count_related(
+                        related_model, related_field))
+                    .exclude(**{field: F('actual')})
+                    .values_list('pk', 'actual')
+                    .iterator())
+            ]
+            drifted_total += len(drifted)
+            if drifted and not options['verify']:
+                model.objects.bulk_update(
+                    drifted, (field,), batch_size=BULK_BATCH_SIZE)
+            self.stdout.write(
+                f'{model._meta.model_name}.{field}: '
+                f'{len(drifted)} rows drifted.')
+        if drifted_total and options['verify']:
+            raise CommandError(
+                f'{drifted_total} counters differ; '
+                f'run without --verify to repair.')
+        self.stdout.write(self.style.SUCCESS('Counters are consistent.'))
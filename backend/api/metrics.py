@@ -0,0 +1,208 @@
+import json
+import os
+from collections import defaultdict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# имя: (тип, описание, границы гистограммы)
+METRICS = {
+    'foodgram_requests_total': (
+        'counter', 'Запросы по view, действию, методу и статусу.', None),
+    'foodgram_request_duration_seconds': (
+        'histogram', 'Время обработки запроса.', LATENCY_BUCKETS),
+    'foodgram_request_db_queries': (
+        'histogram', 'Число SQL-запросов на запрос.', QUERY_BUCKETS),
+    'foodgram_db_query_seconds_total': (
+        'counter', 'Суммарное время SQL-запросов.', None),
+    'foodgram_response_size_bytes': (
+        'histogram', 'Размер тела ответа.', SIZE_BUCKETS),
+    'foodgram_cache_requests_total': (
+        'counter', 'Попадания (hit) и промахи (miss) кэшей.', None),
+    'foodgram_auth_failures_total': (
+        'counter', 'Неудачные входы и недействительные токены.', None),
+}
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+
+
+class Registry:
+    """
+    Значения метрик процесса {(ряд, метки): число}. Каждый воркер пишет
+    их в свой файл METRICS_DIR/<pid>.json не чаще METRICS_FLUSH_INTERVAL,
+    /metrics суммирует файлы всех воркеров. Файлы завершившихся воркеров
+    остаются: счётчики не уменьшаются.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, f'{self.pid}.json')
+        self.values = defaultdict(float)
+        self.lock = Lock()
+        self.flushed = monotonic()
+        # Воркер мог получить pid завершившегося: продолжаем его счётчики
+        for series, labels, value in read(self.path):
+            self.values[series, labels] += value
+
+    def inc(self, series, labels, value=1):
+        with self.lock:
+            self.values[series, labels] += value
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            for bound in METRICS[name][2]:
+                if value <= bound:
+                    self.values[f'{name}_bucket',
+                                labels + (('le', str(bound)),)] += 1
+            self.values[f'{name}_bucket', labels + (('le', '+Inf'),)] += 1
+            self.values[f'{name}_sum', labels] += value
+            self.values[f'{name}_count', labels] += 1
+
+    def flush(self, force=False):
+        if not force and (monotonic() - self.flushed
+                          < settings.METRICS_FLUSH_INTERVAL):
+            return
+        # Под блокировкой: /metrics и запросы пишут файл из разных потоков
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = f'{self.path}.tmp'
+            with open(temporary, 'w') as file:
+                json.dump([[series, labels, value] for (series, labels), value
+                           in self.values.items()], file)
+            os.replace(temporary, self.path)  # Читатель не увидит половину
+            self.flushed = monotonic()
+
+
+registry = None
+
+
+def get_registry():
+    """Реестр текущего процесса: после fork создаётся заново."""
+    global registry
+    if (registry is None or registry.pid != os.getpid()
+            or registry.directory != settings.METRICS_DIR):
+        registry = Registry(settings.METRICS_DIR)
+    return registry
+
+
+def read(path):
+    """Строки файла воркера с метками в виде кортежа пар."""
+    try:
+        with open(path) as file:
+            rows = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return []
+    return [(series, tuple(map(tuple, labels)), value)
+            for series, labels, value in rows]
+
+
+def make_labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    if settings.METRICS_ENABLED:
+        get_registry().inc(name, make_labels(labels), value)
+
+
+def observe(name, value, **labels):
+    if settings.METRICS_ENABLED:
+        get_registry().observe(name, make_labels(labels), value)
+
+
+def count_cache(cache, hits=0, misses=0):
+    if hits:
+        inc('foodgram_cache_requests_total', hits, cache=cache, result='hit')
+    if misses:
+        inc('foodgram_cache_requests_total', misses,
+            cache=cache, result='miss')
+
+
+def get_view_labels(request):
+    """view — класс DRF-view (или имя маршрута), action — действие ViewSet."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return {'view': 'unmatched', 'action': ''}
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return {'view': match.view_name, 'action': ''}
+    actions = getattr(match.func, 'actions', None) or {}
+    return {'view': view_class.__name__,
+            'action': actions.get(request.method.lower(), '')}
+
+
+def get_response_size(response):
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+def observe_request(request, response, timing):
+    """Вызывается ServerTimingMiddleware для каждого запроса."""
+    labels = get_view_labels(request)
+    inc('foodgram_requests_total', method=request.method,
+        status=response.status_code, **labels)
+    observe('foodgram_request_duration_seconds', timing.total, **labels)
+    observe('foodgram_request_db_queries', timing.queries, **labels)
+    inc('foodgram_db_query_seconds_total', timing.sql, **labels)
+    size = get_response_size(response)
+    if size is not None:
+        observe('foodgram_response_size_bytes', size, **labels)
+    if labels['view'] == 'TokenCreateView' and response.status_code >= 400:
+        inc('foodgram_auth_failures_total', reason='login')
+    get_registry().flush()
+
+
+def collect():
+    """Сумма значений из файлов всех воркеров."""
+    get_registry().flush(force=True)
+    values = defaultdict(float)
+    for name in os.listdir(settings.METRICS_DIR):
+        if name.endswith('.json'):
+            path = os.path.join(settings.METRICS_DIR, name)
+            for series, labels, value in read(path):
+                values[series, labels] += value
+    return values
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def format_series(series, labels, value):
+    if labels:
+        series += '{%s}' % ','.join(
+            f'{key}="{escape(label)}"' for key, label in labels)
+    if value == int(value):
+        value = int(value)
+    return f'{series} {value!r}'
+
+
+def series_order(item):
+    """Бакеты гистограммы по возрастанию le."""
+    (series, labels), value = item
+    bound = dict(labels).get('le')
+    return (series, tuple(label for label in labels if label[0] != 'le'),
+            float(bound) if bound is not None else 0)
+
+
+def render():
+    """Текстовый формат Prometheus (version 0.0.4)."""
+    values = sorted(collect().items(), key=series_order)
+    lines = []
+    for name, (kind, description, _) in METRICS.items():
+        series_names = ({name + suffix for suffix in HISTOGRAM_SUFFIXES}
+                        if kind == 'histogram' else {name})
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        lines += [
+            format_series(series, labels, value)
+            for (series, labels), value in values if series in series_names]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.3 on 2026-10-17 03:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_totals(apps, schema_editor):
+    ShoppingCart = apps.get_model('api', 'ShoppingCart')
+    ShoppingCartTotal = apps.get_model('api', 'ShoppingCartTotal')
+    rows = (
+        ShoppingCart.objects
+        .filter(recipe__recipe_ingredients__isnull=False)
+        .values('user_id', ingredient_id=models.F(
+            'recipe__recipe_ingredients__ingredient_id'))
+        .annotate(amount=models.Sum('recipe__recipe_ingredients__amount'))
+        .order_by()
+    )
+    ShoppingCartTotal.objects.bulk_create(
+        (ShoppingCartTotal(**row) for row in rows.iterator()),
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0004_auto_20250115_1842'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(default=0, verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to='api.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+                'ordering': ('user', 'ingredient'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcarttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_cart_total'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
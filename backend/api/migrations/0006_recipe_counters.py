@@ -0,0 +1,50 @@
+# Generated by Django 3.2.3 on 2026-10-17 03:58
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_related(model, field):
+    return Coalesce(models.Subquery(
+        model.objects
+        .filter(**{field: models.OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=models.Count('pk'))
+        .values('count')), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+    FavoriteRecipe = apps.get_model('api', 'FavoriteRecipe')
+    ShoppingCart = apps.get_model('api', 'ShoppingCart')
+    Subscription = apps.get_model('api', 'Subscription')
+    UserProfile = apps.get_model('users', 'UserProfile')
+    Recipe.objects.update(
+        favorites_count=count_related(FavoriteRecipe, 'recipe'),
+        shopping_cart_count=count_related(ShoppingCart, 'recipe'))
+    UserProfile.objects.update(
+        recipes_count=count_related(Recipe, 'author'),
+        subscribers_count=count_related(Subscription, 'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_shoppingcarttotal'),
+        ('users', '0004_userprofile_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число добавлений в список покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+INDEX_NAME = 'api_ingredient_name_trgm'
+
+
+def create_trigram_index(apps, schema_editor):
+    # GIN-индекс pg_trgm есть только в PostgreSQL; SQLite ищет в памяти
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+        f'ON api_ingredient USING gin (name gin_trgm_ops)')
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.3 on 2026-10-17 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favoriterecipe',
+            index=models.Index(fields=['recipe', 'user'], name='favoriterecipe_recipe_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['recipe', 'user'], name='shoppingcart_recipe_user_idx'),
+        ),
+    ]
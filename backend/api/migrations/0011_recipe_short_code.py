@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-17 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='short_code',
+            field=models.CharField(editable=False, max_length=6, null=True, unique=True, verbose_name='Код короткой ссылки'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from api.constants import BULK_BATCH_SIZE
+from api.short_links import encode
+from django.db import migrations
+
+
+def backfill_short_codes(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+    recipes = [Recipe(pk=pk, short_code=encode(pk))
+               for pk in Recipe.objects.filter(
+                   short_code__isnull=True).values_list('pk', flat=True)]
+    Recipe.objects.bulk_update(recipes, ('short_code',),
+                               batch_size=BULK_BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_recipe_short_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_short_codes, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,27 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (Case, Exists, F, OuterRef, Prefetch, Sum, Value,
+                              When)
+from django.utils import timezone
+from users.models import UpdateManagedFieldsMixin
 
 from .constants import (INGREDIENT_NAME_MAX_LENGTH,
                         MEASUREMENT_UNIT_MAX_LENGTH, MIN_AMOUNT_VALUE,
                         MIN_TIME_VALUE, RECIPE_NAME_MAX_LENGTH,
+                        SHOPPING_CART_CHUNK_SIZE, SHORT_CODE_LENGTH,
                         TAG_DATA_MAX_LENGTH)
 
 User = get_user_model()
 
 
+def change_counter(queryset, field, delta):
+    """Атомарно меняем счётчик через F(), не опуская его ниже нуля."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
 class Ingredient(models.Model):
     """Модель Ингредиента."""
 
@@ -56,7 +68,30 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Запросы к рецептам с заранее подгруженными связями."""
+
+    def with_related(self):
+        """Автор, теги и ингредиенты за фиксированное число запросов."""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch('recipe_ingredients',
+                     queryset=IngredientRecipe.objects.select_related(
+                         'ingredient')))
+
+    def with_user_flags(self, user):
+        """Аннотируем флаги is_favorited и is_in_shopping_cart."""
+        if not user.is_authenticated:
+            return self.annotate(is_favorited=Value(False),
+                                 is_in_shopping_cart=Value(False))
+        return self.annotate(
+            is_favorited=Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
+
+
+class Recipe(UpdateManagedFieldsMixin, models.Model):
     """Модель рецепта."""
 
     name = models.CharField('Название', max_length=RECIPE_NAME_MAX_LENGTH)
@@ -72,6 +107,8 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Картинка готового блюда',
         upload_to='recipes/images/')
+    image_variants = models.JSONField(
+        'Уменьшенные копии картинки', default=dict, editable=False)
     ingredients = models.ManyToManyField(
         Ingredient,
         through='IngredientRecipe',
@@ -82,15 +119,33 @@ class Recipe(models.Model):
         related_name='recipes',
         verbose_name='Теги',)
     pub_date = models.DateTimeField(auto_now_add=True)
+    # Счётчики обновляются через F() при добавлении/удалении связей
+    favorites_count = models.PositiveIntegerField(
+        'Число добавлений в избранное', default=0, editable=False)
+    shopping_cart_count = models.PositiveIntegerField(
+        'Число добавлений в список покупок', default=0, editable=False)
+    short_code = models.CharField(
+        'Код короткой ссылки', max_length=SHORT_CODE_LENGTH, unique=True,
+        null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+    update_managed_fields = ('favorites_count', 'shopping_cart_count')
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [  # Ключ курсорной пагинации ленты
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+            # Фильтр по автору с сортировкой ленты
+            models.Index(fields=('author', '-pub_date'),
+                         name='recipe_author_pub_date_idx'),
+        ]
 
     def favorite_count(self):
         """Возвращает кол-во пользователей, добавивших рецепт в избранное."""
-        return self.favoriterecipe_items.count()
+        return self.favorites_count
 
     def __str__(self):
         return self.name
@@ -141,22 +196,125 @@ class BaseUserAndRecipeRelation(models.Model):
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='unique_%(class)s_items')
         ]
+        indexes = [  # Связи со стороны рецепта: счётчики, EXISTS
+            models.Index(fields=['recipe', 'user'],
+                         name='%(class)s_recipe_user_idx')
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.recipe.name}"
 
+    @classmethod
+    def change_counter(cls, recipe_id, delta):
+        """Атомарно меняем счётчик связей у рецепта."""
+        change_counter(Recipe.objects.filter(pk=recipe_id),
+                       cls.counter_field, delta)
+
 
 class ShoppingCart(BaseUserAndRecipeRelation):
     """Модель корзины покупок для приготовления рецепта."""
 
+    counter_field = 'shopping_cart_count'
+
     class Meta(BaseUserAndRecipeRelation.Meta):
         verbose_name = 'Корзина покупок'
         verbose_name_plural = 'Корзины покупок'
 
+    @staticmethod
+    def mark_changed(**lookup):
+        """Отмечаем изменение списков покупок (для ETag/Last-Modified)."""
+        User.objects.filter(**lookup).update(
+            shopping_cart_changed=timezone.now())
+
+
+class ShoppingCartTotalManager(models.Manager):
+    """Инкрементальное обновление итогов списка покупок."""
+
+    def apply(self, user_ids, deltas):
+        """Прибавляем к итогам пользователей изменения {ingredient_id: n}."""
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        user_ids = list(user_ids)
+        if not deltas or not user_ids:
+            return
+        with transaction.atomic():
+            self.bulk_create(  # Недостающие строки создаём с нулём
+                (self.model(user_id=user_id, ingredient_id=ingredient_id)
+                 for user_id in user_ids for ingredient_id in deltas),
+                ignore_conflicts=True)
+            totals = self.filter(user_id__in=user_ids,
+                                 ingredient_id__in=deltas)
+            totals.update(amount=F('amount') + Case(
+                *(When(ingredient_id=pk, then=Value(delta))
+                  for pk, delta in deltas.items()),
+                default=Value(0)))
+            totals.filter(amount__lte=0).delete()
+
+    def add_recipe(self, user_ids, recipe_id, sign=1):
+        """Добавляем рецепт в итоги (sign=-1 — убираем)."""
+        self.apply(user_ids, {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in IngredientRecipe.objects.filter(
+                recipe_id=recipe_id).values_list('ingredient_id', 'amount')})
+
+    def change_recipe(self, recipe_id, deltas):
+        """Изменения ингредиентов рецепта {ingredient_id: n} в корзинах."""
+        if any(deltas.values()):
+            self.apply(ShoppingCart.objects.filter(
+                recipe_id=recipe_id).values_list('user_id', flat=True), deltas)
+            ShoppingCart.mark_changed(shoppingcart__recipe_id=recipe_id)
+
+    def live(self):
+        """Итоги, посчитанные заново по корзинам и рецептам."""
+        return (
+            ShoppingCart.objects
+            .filter(recipe__recipe_ingredients__isnull=False)
+            .values('user_id', ingredient_id=F(
+                'recipe__recipe_ingredients__ingredient_id'))
+            .annotate(amount=Sum('recipe__recipe_ingredients__amount'))
+            .order_by()
+        )
+
+    @transaction.atomic
+    def rebuild(self):
+        """Пересобираем все итоги по корзинам; возвращаем число строк."""
+        self.all().delete()
+        return len(self.bulk_create(
+            (self.model(**row) for row in self.live().iterator()),
+            batch_size=SHOPPING_CART_CHUNK_SIZE))
+
+
+class ShoppingCartTotal(models.Model):
+    """Итоговое количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='shopping_cart_totals')
+    ingredient = models.ForeignKey(Ingredient,
+                                   on_delete=models.CASCADE,
+                                   related_name='shopping_cart_totals',
+                                   verbose_name='Ингредиент')
+    amount = models.IntegerField('Количество', default=0)
+
+    objects = ShoppingCartTotalManager()
+
+    class Meta:
+        ordering = ('user', 'ingredient')
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_cart_total')
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.ingredient}: {self.amount}"
+
 
 class FavoriteRecipe(BaseUserAndRecipeRelation):
     """Модель избранных рецептов у пользователя."""
 
+    counter_field = 'favorites_count'
+
     class Meta(BaseUserAndRecipeRelation.Meta):
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
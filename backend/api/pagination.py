@@ -0,0 +1,87 @@
+from django.db import connection
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация по (pub_date, id): цена страницы не растёт.
+    Другая сортировка (ordering) с курсором не сочетается.
+    """
+
+    ordering = ('-pub_date', '-id')
+    page_size_query_param = 'limit'
+    ordering_query_param = 'ordering'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.ordering_query_param in request.query_params:
+            raise ValidationError({self.ordering_query_param: (
+                'Курсорная пагинация поддерживает только сортировку '
+                'по дате публикации.')})
+        return super().paginate_queryset(queryset, request, view)
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк из плана PostgreSQL вместо COUNT(*). План читаем
+    курсором: QuerySet.explain() отдаёт JSON как repr списка.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]  # psycopg2 разбирает json сам
+    return plan[0]['Plan']['Plan Rows']
+
+
+class RecipePagination(LimitOffsetPagination):
+    """
+    Пагинация ленты рецептов.
+    По умолчанию limit/offset с точным count;
+    count=none — без COUNT(*), count=estimate — оценка по плану запроса;
+    pagination=cursor (или параметр cursor) — курсорная пагинация.
+    """
+
+    count_query_param = 'count'
+    mode_query_param = 'pagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (request.query_params.get(self.mode_query_param) == 'cursor'
+                or RecipeCursorPagination.cursor_query_param
+                in request.query_params):
+            self.cursor_paginator = RecipeCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        self.count_mode = request.query_params.get(self.count_query_param)
+        if self.count_mode not in ('none', 'estimate'):
+            return super().paginate_queryset(queryset, request, view)
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.request = request
+        # Лишняя строка показывает, есть ли следующая страница
+        page = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(page) > self.limit
+        self.count = (estimate_count(queryset)
+                      if self.count_mode == 'estimate' else None)
+        return page[:self.limit]
+
+    def get_next_link(self):
+        if self.count_mode not in ('none', 'estimate'):
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = replace_query_param(
+            self.request.build_absolute_uri(),
+            self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
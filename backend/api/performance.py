@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import random
+import re
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from rest_framework import serializers
+
+from . import metrics
+
+logger = logging.getLogger('api.performance')
+
+# Замеры текущего запроса; None — замеры для него не нужны.
+# Контекст копируется в поток пула async-view (run_in_pool)
+current = ContextVar('request_timing', default=None)
+
+FINGERPRINT_MAX_LENGTH = 200
+SLOW_QUERIES_LOGGED = 5
+
+
+def fingerprint(sql):
+    """Шаблон запроса без чисел и длины списков IN (...)."""
+    sql = re.sub(r'\s+', ' ', sql)
+    sql = re.sub(r'IN \((?:%s, )*%s\)', 'IN (...)', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return sql[:FINGERPRINT_MAX_LENGTH]
+
+
+class RequestTiming:
+    """Счётчики одного запроса, время в секундах."""
+
+    def __init__(self, sampled):
+        self.sampled = sampled  # Заголовок, бюджеты и шаблоны SQL
+        self.started = perf_counter()
+        self.total = 0
+        self.queries = 0
+        self.sql = 0
+        self.serializer = 0
+        self.serializing = False
+        self.fingerprints = Counter()
+
+    def finish(self):
+        self.total = perf_counter() - self.started
+
+    def header(self):
+        return (f'db;dur={self.sql * 1000:.1f};desc="{self.queries} queries", '
+                f'serializer;dur={self.serializer * 1000:.1f}, '
+                f'total;dur={self.total * 1000:.1f}')
+
+    def over_budget(self):
+        return (self.queries > settings.PERFORMANCE_QUERY_BUDGET
+                or self.total * 1000 > settings.PERFORMANCE_TIME_BUDGET)
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка курсора, постоянно стоит на всех соединениях."""
+    timing = current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.sql += perf_counter() - started
+        timing.queries += 1
+        if timing.sampled:
+            timing.fingerprints[fingerprint(sql)] += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """Обработчик connection_created: после переподключения не дублируем."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def timed_data(prop):
+    """
+    Свойство data с замером времени. Вложенные сериализаторы (фрагменты
+    рецептов) входят во время внешнего.
+    """
+    def data(self):
+        timing = current.get()
+        if timing is None or timing.serializing:
+            return prop.fget(self)
+        timing.serializing = True
+        started = perf_counter()
+        try:
+            return prop.fget(self)
+        finally:
+            timing.serializer += perf_counter() - started
+            timing.serializing = False
+    return property(data)
+
+
+def instrument_serializers():
+    for serializer_class in (serializers.Serializer,
+                             serializers.ListSerializer):
+        serializer_class.data = timed_data(serializer_class.data)
+
+
+class ServerTimingMiddleware:
+    """
+    Заголовок Server-Timing для доли запросов SERVER_TIMING_SAMPLE_RATE:
+    число и время SQL, время сериализаторов и всего запроса. Запросы сверх
+    PERFORMANCE_QUERY_BUDGET или PERFORMANCE_TIME_BUDGET (мс) пишутся в лог
+    с самыми частыми шаблонами SQL. При METRICS_ENABLED замеры всех
+    запросов уходят в метрики, иначе вне выборки цена — одна проверка
+    contextvar на запрос к БД.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Как MiddlewareMixin: под ASGI не занимаем общий sync-поток
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timing = self.start()
+        if timing is None:
+            return self.get_response(request)
+        token = current.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timing)
+
+    async def __acall__(self, request):
+        timing = self.start()
+        if timing is None:
+            return await self.get_response(request)
+        token = current.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timing)
+
+    @staticmethod
+    def start():
+        sampled = random.random() < settings.SERVER_TIMING_SAMPLE_RATE
+        if not sampled and not settings.METRICS_ENABLED:
+            return None
+        return RequestTiming(sampled)
+
+    @staticmethod
+    def finish(request, response, timing):
+        timing.finish()
+        if settings.METRICS_ENABLED:
+            metrics.observe_request(request, response, timing)
+        if not timing.sampled:
+            return response
+        response['Server-Timing'] = timing.header()
+        if timing.over_budget():
+            logger.warning(
+                'Request over budget: %s %s -> %s, %d queries, '
+                'SQL %.1f ms, serializer %.1f ms, total %.1f ms; SQL: %s',
+                request.method, request.get_full_path(),
+                response.status_code, timing.queries, timing.sql * 1000,
+                timing.serializer * 1000, timing.total * 1000,
+                '; '.join(f'{count}x {sql}' for sql, count in
+                          timing.fingerprints.most_common(
+                              SLOW_QUERIES_LOGGED)))
+        return response
@@ -0,0 +1,75 @@
+from collections import namedtuple
+from hashlib import sha1
+from threading import Lock
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from . import metrics
+from .serializers import IngredientSerializer, TagSerializer
+
+# content и etag списка, {id: (content, etag)} для объектов
+Snapshot = namedtuple('Snapshot', ('version', 'list', 'items'))
+
+
+def render(data):
+    """JSON-байты и строгий ETag для них."""
+    content = JSONRenderer().render(data)
+    return content, f'"{sha1(content).hexdigest()}"'
+
+
+class ReferenceCache:
+    """
+    Неизменяемый снимок справочника (теги, ингредиенты) в памяти процесса:
+    готовые JSON-байты списка и каждого объекта.
+    Версия хранится в общем кэше, поэтому изменение в одном воркере
+    сбрасывает снимки во всех.
+    """
+
+    def __init__(self, name, serializer_class):
+        self.version_key = f'reference:{name}:version'
+        self.serializer_class = serializer_class
+        self.snapshot = Snapshot(None, None, None)
+        self.lock = Lock()
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:  # Версии ещё нет или кэш очищен
+            cache.add(self.version_key, uuid4().hex, None)
+            version = cache.get(self.version_key)
+        return version
+
+    def bump(self):
+        cache.set(self.version_key, uuid4().hex, None)
+
+    def invalidate(self):
+        """
+        Меняем версию сразу и ещё раз после коммита: снимок, собранный
+        другим воркером до коммита, не останется актуальным.
+        """
+        self.bump()
+        transaction.on_commit(self.bump)
+
+    def get(self):
+        """Возвращает актуальный снимок, пересобирая его при смене версии."""
+        version = self.get_version()
+        metrics.count_cache(
+            'reference', hits=int(self.snapshot.version == version),
+            misses=int(self.snapshot.version != version))
+        if self.snapshot.version != version:
+            with self.lock:
+                if self.snapshot.version != version:
+                    self.snapshot = self.build(version)
+        return self.snapshot
+
+    def build(self, version):
+        model = self.serializer_class.Meta.model
+        data = self.serializer_class(model.objects.all(), many=True).data
+        return Snapshot(version, render(data),
+                        {item['id']: render(item) for item in data})
+
+
+tags_cache = ReferenceCache('tags', TagSerializer)
+ingredients_cache = ReferenceCache('ingredients', IngredientSerializer)
@@ -0,0 +1,105 @@
+from hashlib import sha1
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+
+FEED = 'recipes:tag:feed'  # Ленты без фильтра по автору
+REFERENCE = 'recipes:tag:reference'  # Теги и ингредиенты внутри рецептов
+
+
+def recipe_tag(recipe_id):
+    return f'recipes:tag:recipe:{recipe_id}'
+
+
+def author_tag(author_id):
+    return f'recipes:tag:author:{author_id}'
+
+
+def get_versions(tags):
+    """
+    Текущие версии меток. Запись кэша действительна, пока версии всех её
+    меток не изменились, поэтому правка рецепта сбрасывает только
+    зависящие от него ответы.
+    """
+    versions = cache.get_many(tags)
+    missing = {tag: uuid4().hex for tag in tags if tag not in versions}
+    if missing:
+        for tag, version in missing.items():
+            cache.add(tag, version, None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def make_key(kind, request):
+    """Ключ по нормализованной строке запроса: порядок параметров не важен."""
+    query = '&'.join(
+        f'{key}={value}'
+        for key in sorted(request.query_params)
+        for value in sorted(request.query_params.getlist(key)))
+    # Ссылки на картинки абсолютные, поэтому хост тоже входит в ключ
+    query = f'{request.get_host()}?{query}'
+    return f'recipes:response:{kind}:{sha1(query.encode()).hexdigest()}'
+
+
+def get_cached(key):
+    entry = cache.get(key)
+    if entry is None or cache.get_many(entry[0]) != entry[0]:
+        metrics.count_cache('response', misses=1)
+        return None
+    metrics.count_cache('response', hits=1)
+    return entry[1]
+
+
+def store(key, content, versions):
+    """
+    versions читаются до построения ответа, чтобы не закэшировать данные,
+    устаревшие из-за параллельной правки.
+    """
+    cache.set(key, (versions, content),
+              settings.RECIPE_RESPONSE_CACHE_TIMEOUT)
+
+
+def invalidate(*tags):
+    """Сбрасываем метки сразу и после коммита транзакции."""
+    cache.delete_many(tags)
+    transaction.on_commit(lambda: cache.delete_many(tags))
+
+
+def invalidate_recipe(recipe):
+    invalidate(recipe_tag(recipe.id), author_tag(recipe.author_id), FEED)
+
+
+def invalidate_author(author_id):
+    invalidate(author_tag(author_id), FEED)
+
+
+def fragment_key(recipe, versions):
+    """Версии меток в ключе: после правки старый фрагмент не читается."""
+    return ':'.join((
+        f'recipes:fragment:{recipe.id}', versions[REFERENCE],
+        versions[recipe_tag(recipe.id)],
+        versions[author_tag(recipe.author_id)]))
+
+
+def get_fragments(recipes, build):
+    """
+    Общие для всех читателей фрагменты рецептов {id: данные}: одно чтение
+    версий и одно чтение фрагментов, build(ids) собирает недостающие.
+    """
+    tags = {REFERENCE}
+    for recipe in recipes:
+        tags.update((recipe_tag(recipe.id), author_tag(recipe.author_id)))
+    versions = get_versions(tags)
+    keys = {recipe.id: fragment_key(recipe, versions) for recipe in recipes}
+    fragments = cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in fragments]
+    metrics.count_cache('fragment', hits=len(fragments), misses=len(missing))
+    if missing:
+        built = {keys[pk]: fragment for pk, fragment in build(missing).items()}
+        cache.set_many(built, settings.RECIPE_RESPONSE_CACHE_TIMEOUT)
+        fragments.update(built)
+    return {pk: fragments[key] for pk, key in keys.items() if key in fragments}
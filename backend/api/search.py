@@ -0,0 +1,131 @@
+from bisect import bisect_left
+from threading import Lock
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import (BooleanField, Case, Func, IntegerField, Q, Value,
+                              When)
+
+from .constants import (INGREDIENT_SEARCH_FUZZY_THRESHOLD,
+                        INGREDIENT_SEARCH_MIN_LENGTH)
+from .models import Ingredient
+from .reference_cache import ingredients_cache
+
+PREFIX, CONTAINS, FUZZY = range(3)
+
+
+class TrigramWordSimilar(Func):
+    """
+    name %> term: слово из term похоже на часть name (pg_trgm).
+    Условие-выражение, а не lookup: не регистрируется на всех CharField.
+    """
+
+    arg_joiner = ' %%> '
+    template = '%(expressions)s'
+    output_field = BooleanField()
+
+
+def trigrams(text):
+    """Триграммы слов как в pg_trgm: слово дополняется пробелами."""
+    result = set()
+    for word in text.split():
+        word = f'  {word} '
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса (для SQLite): отсортированный
+    массив названий для поиска по началу и триграммы для нечёткого поиска.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: row[1])
+        self.ids = [pk for pk, _ in rows]
+        self.names = [name for _, name in rows]
+        self.trigrams = [trigrams(name) for name in self.names]
+        self.postings = {}  # триграмма -> позиции названий
+        for position, name_trigrams in enumerate(self.trigrams):
+            for trigram in name_trigrams:
+                self.postings.setdefault(trigram, []).append(position)
+
+    def search(self, term):
+        """Возвращает id: сначала по началу, затем по вхождению и похожие."""
+        start = bisect_left(self.names, term)
+        end = bisect_left(self.names, term + '\uffff', start)
+        found = list(range(start, end))
+        if len(term) >= INGREDIENT_SEARCH_MIN_LENGTH:
+            seen = set(found)
+            found.extend(
+                position for position, name in enumerate(self.names)
+                if position not in seen and term in name)
+            seen.update(found)
+            found.extend(self.fuzzy(term, seen))
+        return [self.ids[position] for position in found]
+
+    def fuzzy(self, term, exclude):
+        """Доля триграмм запроса, найденных в названии (word_similarity)."""
+        term_trigrams = trigrams(term)
+        hits = {}
+        for trigram in term_trigrams:
+            for position in self.postings.get(trigram, ()):
+                hits[position] = hits.get(position, 0) + 1
+        scored = [
+            # Как в PostgreSQL: затем по сходству с названием целиком
+            (-count / len(term_trigrams),
+             -count / len(term_trigrams | self.trigrams[position]),
+             self.names[position], position)
+            for position, count in hits.items()
+            if position not in exclude
+            and count / len(term_trigrams) >= INGREDIENT_SEARCH_FUZZY_THRESHOLD
+        ]
+        return [position for *_, position in sorted(scored)]
+
+
+class IngredientSearch:
+    """Поиск ингредиентов для автодополнения."""
+
+    _index = None
+    _version = None
+    _lock = Lock()
+
+    @classmethod
+    def get_index(cls):
+        # Индекс пересобирается вместе со снимком справочника ингредиентов
+        version = ingredients_cache.get_version()
+        with cls._lock:
+            if cls._version != version:
+                cls._index = IngredientIndex(
+                    Ingredient.objects.values_list('id', 'name'))
+                cls._version = version
+            return cls._index
+
+    @classmethod
+    def filter(cls, queryset, term):
+        term = term.strip().lower()  # Названия хранятся в нижнем регистре
+        if not term:
+            return queryset
+        if connection.vendor == 'postgresql':
+            return cls.filter_postgresql(queryset, term)
+        ids = cls.get_index().search(term)
+        return queryset.filter(pk__in=ids).order_by(Case(
+            *(When(pk=pk, then=Value(position))
+              for position, pk in enumerate(ids)),
+            output_field=IntegerField()))
+
+    @staticmethod
+    def filter_postgresql(queryset, term):
+        """Один запрос по GIN-индексу pg_trgm с ранжированием."""
+        condition = Q(name__startswith=term)
+        if len(term) >= INGREDIENT_SEARCH_MIN_LENGTH:
+            condition |= (Q(name__contains=term)
+                          | Q(TrigramWordSimilar('name', Value(term))))
+        return queryset.filter(condition).annotate(
+            rank=Case(
+                When(name__startswith=term, then=Value(PREFIX)),
+                When(name__contains=term, then=Value(CONTAINS)),
+                default=Value(FUZZY),
+                output_field=IntegerField()),
+            similarity=TrigramSimilarity('name', term),
+        ).order_by('rank', '-similarity', 'name')
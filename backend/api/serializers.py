@@ -1,13 +1,52 @@
-from drf_extra_fields.fields import Base64ImageField
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
+from django.db.models.fields.files import FieldFile
 from rest_framework import serializers
 
+from . import response_cache
+from .fields import StreamingBase64ImageField
 from .models import (FavoriteRecipe, Ingredient, IngredientRecipe, Recipe,
-                     ShoppingCart, Subscription, Tag, User)
+                     ShoppingCart, ShoppingCartTotal, Subscription, Tag, User)
 
 
-class FullUserSerializer(serializers.ModelSerializer):
+class ImageVariantField(serializers.ImageField):
+    """Ссылка на уменьшенную копию картинки, пока её нет — на оригинал."""
+
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if value:
+            variants = getattr(value.instance, f'{value.field.name}_variants')
+            if (variants.get('source') == value.name
+                    and self.variant in variants):
+                value = FieldFile(
+                    value.instance, value.field, variants[self.variant])
+        return super().to_representation(value)
+
+
+class SubscribedMixin:
+    """Подписан ли текущий пользователь на автора."""
+
+    def get_is_subscribed(self, obj):
+        request = self.context.get('request')
+        if not request or not request.user.is_authenticated:
+            return False
+        # Подписки читаем один раз за запрос для всех вложенных авторов
+        if not hasattr(request, 'subscribed_ids'):
+            request.subscribed_ids = set(
+                request.user.subscriptions.values_list(
+                    'author_id', flat=True))
+        return obj.id in request.subscribed_ids
+
+
+class FullUserSerializer(SubscribedMixin, serializers.ModelSerializer):
     """Serializer to manage user."""
-    avatar = Base64ImageField()
+    avatar = ImageVariantField('small')
+    is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -20,6 +59,7 @@ class FullUserSerializer(serializers.ModelSerializer):
 
 class UserAvatarSerializer(FullUserSerializer):
     """Serializer of user avatar."""
+    avatar = StreamingBase64ImageField()
 
     class Meta:
         model = User
@@ -63,7 +103,7 @@ class IngredientsInRecipeFullSerializer(IngredientSerializer):
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(required=True, allow_null=False)
+    image = ImageVariantField('small')
 
     class Meta:
         model = Recipe
@@ -75,7 +115,7 @@ class FullRecipeSerializer(serializers.ModelSerializer):
     author = FullUserSerializer(many=False)
     ingredients = IngredientsInRecipeFullSerializer(
         source='recipe_ingredients', many=True)
-    image = Base64ImageField(required=True, allow_null=False)
+    image = ImageVariantField('medium')
     is_favorited = serializers.SerializerMethodField(default=False)
     is_in_shopping_cart = serializers.SerializerMethodField(default=False)
 
@@ -88,6 +128,8 @@ class FullRecipeSerializer(serializers.ModelSerializer):
         read_only_fields = ('tags', 'author',)
 
     def get_is_favorited(self, obj):  # Добавлен ли рецепт в избранное?
+        if hasattr(obj, 'is_favorited'):  # Аннотация из with_user_flags
+            return obj.is_favorited
         request = self.context.get('request')
         if request.user.is_authenticated:
             return FavoriteRecipe.objects.filter(
@@ -95,6 +137,8 @@ class FullRecipeSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):  # Добавлен ли рецепт в корзину?
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request.user.is_authenticated:
             return ShoppingCart.objects.filter(
@@ -102,6 +146,68 @@ class FullRecipeSerializer(serializers.ModelSerializer):
         return False
 
 
+class CachedRecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        return self.child.render_many(list(data))
+
+
+class CachedRecipeSerializer(FullRecipeSerializer):
+    """
+    Рецепт из кэша фрагментов: общая для всех читателей часть берётся
+    готовой, флаги текущего пользователя подмешиваются одним запросом.
+    """
+
+    class Meta(FullRecipeSerializer.Meta):
+        list_serializer_class = CachedRecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.render_many([instance])[0]
+
+    def render_many(self, recipes):
+        fragments = response_cache.get_fragments(recipes, self.build_fragments)
+        flags = self.get_flags(fragments)
+        return [self.overlay(fragments[recipe.id], flags.get(recipe.id))
+                for recipe in recipes if recipe.id in fragments]
+
+    @staticmethod
+    def build_fragments(ids):
+        """Без request ссылки на картинки относительные, а флаги False."""
+        recipes = Recipe.objects.filter(pk__in=ids).with_related(
+        ).with_user_flags(AnonymousUser())
+        return {item['id']: item
+                for item in FullRecipeSerializer(recipes, many=True).data}
+
+    def get_flags(self, ids):
+        """{id: (is_favorited, is_in_shopping_cart, is_subscribed)}."""
+        user = self.context['request'].user
+        if not user.is_authenticated:
+            return {}
+        return {
+            pk: flags for pk, *flags in Recipe.objects.filter(
+                pk__in=ids).with_user_flags(user).annotate(
+                is_subscribed=Exists(Subscription.objects.filter(
+                    user=user, author=OuterRef('author')))
+            ).values_list('id', 'is_favorited', 'is_in_shopping_cart',
+                          'is_subscribed')
+        }
+
+    def overlay(self, fragment, flags):
+        request = self.context['request']
+        is_favorited, is_in_shopping_cart, is_subscribed = (
+            flags or (False, False, False))
+        author = fragment['author']
+        data = dict(fragment, is_favorited=is_favorited,
+                    is_in_shopping_cart=is_in_shopping_cart,
+                    image=fragment['image'] and request.build_absolute_uri(
+                        fragment['image']))
+        data['author'] = dict(
+            author, is_subscribed=is_subscribed,
+            avatar=author['avatar'] and request.build_absolute_uri(
+                author['avatar']))
+        return data
+
+
 class WriteRecipeSerializer(serializers.ModelSerializer):
     ingredients = serializers.ListField(
         child=serializers.DictField(
@@ -114,7 +220,7 @@ class WriteRecipeSerializer(serializers.ModelSerializer):
         child=serializers.IntegerField(),
         required=True
     )
-    image = Base64ImageField(required=False, allow_null=True)
+    image = StreamingBase64ImageField(required=False, allow_null=True)
     name = serializers.CharField(max_length=256, required=True)
     text = serializers.CharField(required=True)
     cooking_time = serializers.IntegerField(min_value=1, required=True)
@@ -141,39 +247,39 @@ class WriteRecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Рецепт должен содержать хотя бы один ингредиент.')
 
-        # Проверка на дубликаты ингредиентов и минимальное количество
-        ingredient_ids = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            amount = ingredient.get('amount', 0)
-            if amount < 1:
-                raise serializers.ValidationError(
-                    'Количество ингредиента должно быть больше 0.')
-
-            if ingredient_id in ingredient_ids:
-                raise serializers.ValidationError(
-                    'Ингредиенты не должны повторяться.')
-            ingredient_ids.append(ingredient_id)
-
-        # Проверка существования тегов
-        if not Tag.objects.filter(id__in=tags).exists():
+        # Проверка минимального количества и дубликатов ингредиентов
+        if any(ingredient.get('amount', 0) < 1 for ingredient in ingredients):
             raise serializers.ValidationError(
-                'Один или несколько тегов не существуют.')
+                'Количество ингредиента должно быть больше 0.')
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться.')
 
         # Проверка на дубликаты тегов
         if len(tags) != len(set(tags)):
             raise serializers.ValidationError(
                 'Теги не должны повторяться.')
 
-        # Проверка существования ингредиентов
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            if not Ingredient.objects.filter(id=ingredient_id).exists():
-                raise serializers.ValidationError(
-                    f'Ингредиент с id {ingredient_id} не существует.')
+        # Проверка существования тегов и ингредиентов: по запросу на модель
+        missing_tags = self.get_missing_ids(Tag, tags)
+        if missing_tags:
+            raise serializers.ValidationError(
+                f'Теги с id {missing_tags} не существуют.')
+        missing_ingredients = self.get_missing_ids(Ingredient, ingredient_ids)
+        if missing_ingredients:
+            raise serializers.ValidationError(
+                f'Ингредиенты с id {missing_ingredients} не существуют.')
 
         return data
 
+    @staticmethod
+    def get_missing_ids(model, ids):
+        """Возвращает отсутствующие в базе id строкой через запятую."""
+        existing = set(
+            model.objects.filter(id__in=ids).values_list('id', flat=True))
+        return ', '.join(str(pk) for pk in sorted(set(ids) - existing))
+
     @staticmethod
     def create_or_update_ingredients(recipe, ingredients):
         unique_ingredients = []
@@ -190,33 +296,64 @@ class WriteRecipeSerializer(serializers.ModelSerializer):
 
         IngredientRecipe.objects.bulk_create(unique_ingredients)
 
+    @transaction.atomic
     def create(self, validated_data):
         """Метод создания модели рецепта."""
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        author = self.context['request'].user
         recipe = Recipe.objects.create(  # Создаем рецепт, устанавливаем автора
-            author=self.context['request'].user, **validated_data)
+            author=author, **validated_data)
         recipe.tags.set(tags)
         self.create_or_update_ingredients(recipe, ingredients)
         return recipe
 
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """Сравниваем ингредиенты с сохранёнными и пишем только разницу."""
+        stored = {item.ingredient_id: item
+                  for item in recipe.recipe_ingredients.all()}
+        submitted = {item['id']: item['amount'] for item in ingredients}
+        removed = stored.keys() - submitted.keys()
+        if removed:  # Итоги списков покупок меняют сигналы post_delete
+            recipe.recipe_ingredients.filter(
+                ingredient_id__in=removed).delete()
+        changed = []
+        old_amounts = {}
+        for ingredient_id, item in stored.items():
+            amount = submitted.get(ingredient_id)
+            if amount is not None and item.amount != amount:
+                old_amounts[ingredient_id] = item.amount
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        added = submitted.keys() - stored.keys()
+        if added:
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient_id=ingredient_id,
+                                 amount=submitted[ingredient_id])
+                for ingredient_id in added)
+        if changed or added:  # bulk_update и bulk_create без сигналов
+            deltas = {item.ingredient_id:
+                      item.amount - old_amounts[item.ingredient_id]
+                      for item in changed}
+            deltas.update((pk, submitted[pk]) for pk in added)
+            ShoppingCartTotal.objects.change_recipe(recipe.id, deltas)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Метод редактирования модели рецепта."""
         tags = validated_data.pop('tags', None)
-        instance.tags.set(tags)
         ingredients = validated_data.pop('ingredients', None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)  # Обновляем поля рецепта
-        # Если изображение не передано, оставляем текущее значение
-        if 'image' not in validated_data:
-            validated_data['image'] = instance.image
         instance.save()
-        # Обновляем ингредиенты
-        if ingredients is None or len(ingredients) < 1:
-            raise serializers.ValidationError(
-                'Рецепт должен содержать хотя бы один ингредиент.')
-        instance.ingredients.clear()  # Удаляем старые ингредиенты
-        self.create_or_update_ingredients(instance, ingredients)
+        # Связи трогаем, только если они переданы
+        if tags is not None:
+            instance.tags.set(tags)  # set() добавляет/удаляет только разницу
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
         return instance
 
     def to_representation(self, instance):
@@ -260,11 +397,14 @@ class SubscribeSerializer(serializers.Serializer):
         return value
 
 
-class SubscriptionWithRecipesSerializer(serializers.ModelSerializer):
-    recipes = RecipeMinifiedSerializer(many=True, read_only=True)
-    recipes_count = serializers.IntegerField(source='recipes.count',
-                                             read_only=True)
+class SubscriptionWithRecipesSerializer(SubscribedMixin,
+                                        serializers.ModelSerializer):
+    # Рецепты подгружаются в with_recipes(), их число хранится в профиле
+    recipes = RecipeMinifiedSerializer(
+        source='limited_recipes', many=True, read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
     is_subscribed = serializers.SerializerMethodField()
+    avatar = ImageVariantField('small')
 
     class Meta:
         model = User
@@ -273,30 +413,34 @@ class SubscriptionWithRecipesSerializer(serializers.ModelSerializer):
             'is_subscribed', 'recipes', 'recipes_count', 'avatar'
         )
 
-    def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Subscription.objects.filter(
-                user=request.user, author=obj).exists()
-        return False
+    @staticmethod
+    def get_recipes_limit(request):
+        """Читаем и проверяем параметр recipes_limit."""
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise serializers.ValidationError(
+                {'recipes_limit': 'Некорректное значение для recipes_limit.'})
+        return recipes_limit
 
-    def get_limited_recipes(self, recipes, recipes_limit):
-        """Метод для ограничения количества рецептов."""
+    @staticmethod
+    def with_recipes(queryset, recipes_limit=None):
+        """
+        Первые recipes_limit рецептов каждого автора
+        одним запросом на всю страницу.
+        """
+        recipes = Recipe.objects.all()
         if recipes_limit is not None:
-            try:
-                recipes_limit = int(recipes_limit)
-                return recipes[:recipes_limit]
-            except ValueError:
-                raise serializers.ValidationError(
-                    "Некорректное значение для recipes_limit.")
-        return recipes
-
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        recipes = self.context.get('recipes', [])
-        recipes_limit = self.context.get('recipes_limit', None)
-        limited_recipes = self.get_limited_recipes(recipes, recipes_limit)
-        representation['recipes'] = RecipeMinifiedSerializer(
-            limited_recipes, many=True).data
-        representation['recipes_count'] = len(limited_recipes)
-        return representation
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects
+                .filter(author=OuterRef('author'))
+                .order_by('-pub_date', '-id')
+                .values('pk')[:recipes_limit]))
+        return queryset.prefetch_related(
+            Prefetch('recipes', queryset=recipes.order_by('-pub_date', '-id'),
+                     to_attr='limited_recipes'))
@@ -0,0 +1,87 @@
+import csv
+from io import BytesIO
+
+from django.conf import settings
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from .constants import SHOPPING_CART_NAME_WIDTH
+
+TITLE = 'СПИСОК ПОКУПОК'
+HEADER = ('Название', 'Единица измерения', 'Количество')
+
+
+class Echo:
+    """Псевдобуфер: csv.writer возвращает строку вместо записи в файл."""
+
+    def write(self, value):
+        return value
+
+
+def render_text(items):
+    """Список покупок в текстовом формате с выравниванием по колонкам."""
+    yield f'          <<<{TITLE}>>>\n'
+    yield HEADER[0].upper().ljust(SHOPPING_CART_NAME_WIDTH) + 'КОЛИЧЕСТВО\n'
+    for item in items:
+        yield (f"{item['name'].ljust(SHOPPING_CART_NAME_WIDTH)}"
+               f"{item['amount']} {item['measurement_unit']}\n")
+
+
+def render_csv(items):
+    """Список покупок в формате CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    for item in items:
+        yield writer.writerow(
+            (item['name'], item['measurement_unit'], item['amount']))
+
+
+def render_pdf(items):
+    """Список покупок в формате PDF (нужны reportlab и шрифт с кириллицей)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    font = 'ShoppingListFont'
+    if font not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(font, settings.SHOPPING_LIST_PDF_FONT))
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 18
+    y = height - margin
+    pdf.setFont(font, 16)
+    pdf.drawString(margin, y, TITLE)
+    y -= 2 * line_height
+    pdf.setFont(font, 11)
+    for item in items:
+        if y < margin:  # Переносим на новую страницу
+            pdf.showPage()
+            pdf.setFont(font, 11)
+            y = height - margin
+        pdf.drawString(margin, y, item['name'])
+        pdf.drawRightString(width - margin, y,
+                            f"{item['amount']} {item['measurement_unit']}")
+        y -= line_height
+    pdf.save()
+    # PDF нельзя отдавать по частям до записи таблицы ссылок (xref)
+    yield buffer.getvalue()
+
+
+FORMATS = {  # format: (content_type, расширение, функция вывода)
+    'txt': ('text/plain; charset=utf-8', 'txt', render_text),
+    'csv': ('text/csv; charset=utf-8', 'csv', render_csv),
+    'pdf': ('application/pdf', 'pdf', render_pdf),
+}
+
+
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    """
+    Параметр format задаёт формат файла, а не рендерер DRF,
+    поэтому ошибки отдаём первым рендерером (JSON).
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderer = renderers[0]
+        return renderer, renderer.media_type
@@ -0,0 +1,32 @@
+from string import ascii_letters, digits
+
+from .constants import SHORT_CODE_LENGTH
+
+ALPHABET = digits + ascii_letters
+SPACE = len(ALPHABET) ** SHORT_CODE_LENGTH
+# Взаимно просто с 62**6: соседние id получают непохожие коды
+MULTIPLIER = 1580030173
+INVERSE = pow(MULTIPLIER, -1, SPACE)
+
+
+def encode(recipe_id):
+    """Код base62 фиксированной длины, однозначный для каждого id."""
+    number = recipe_id * MULTIPLIER % SPACE
+    code = []
+    for _ in range(SHORT_CODE_LENGTH):
+        number, rest = divmod(number, len(ALPHABET))
+        code.append(ALPHABET[rest])
+    return ''.join(reversed(code))
+
+
+def decode(code):
+    """
+    id рецепта по коду без запросов к БД; None — код некорректен.
+    Код несуществующего рецепта ведёт на страницу «не найдено» фронтенда.
+    """
+    if len(code) != SHORT_CODE_LENGTH or not set(code) <= set(ALPHABET):
+        return None
+    number = 0
+    for char in code:
+        number = number * len(ALPHABET) + ALPHABET.index(char)
+    return number * INVERSE % SPACE or None
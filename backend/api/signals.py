@@ -0,0 +1,190 @@
+from collections import Counter
+
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import images, response_cache, short_links
+from .authentication import invalidate_tokens
+from .models import (FavoriteRecipe, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, ShoppingCartTotal, Subscription, Tag, User,
+                     change_counter)
+from .reference_cache import ingredients_cache, tags_cache
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    """Снимки ингредиентов и индекс поиска пересоберутся во всех воркерах."""
+    ingredients_cache.invalidate()
+    response_cache.invalidate(response_cache.REFERENCE)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    tags_cache.invalidate()
+    response_cache.invalidate(response_cache.REFERENCE)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, update_fields=None, **kwargs):
+    """Данные автора входят в ответы с его рецептами."""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    response_cache.invalidate_author(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def revoke_token(sender, instance, **kwargs):
+    """Выход (djoser token/logout) удаляет токен."""
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    """Смена пароля, деактивация и правка профиля сбрасывают снимок."""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_tokens(*Token.objects.filter(user=instance).values_list(
+        'key', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    """
+    Правки из API и из админки. Сброс повторяется после коммита, когда
+    теги и ингредиенты той же транзакции уже сохранены; в post_delete
+    id рецепта ещё не обнулён.
+    """
+    response_cache.invalidate_recipe(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def assign_short_code(sender, instance, created, **kwargs):
+    if instance.short_code is None:
+        instance.short_code = short_links.encode(instance.pk)
+        Recipe.objects.filter(pk=instance.pk).update(
+            short_code=instance.short_code)
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, raw=False, **kwargs):
+    """Счётчики связей: из API, админки и каскадом при удалениях."""
+    if created and not raw:
+        sender.change_counter(instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    sender.change_counter(instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=Subscription)
+def increment_subscribers_count(sender, instance, created, raw=False,
+                                **kwargs):
+    if created and not raw:
+        change_counter(User.objects.filter(pk=instance.author_id),
+                       'subscribers_count', 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def decrement_subscribers_count(sender, instance, **kwargs):
+    change_counter(User.objects.filter(pk=instance.author_id),
+                   'subscribers_count', -1)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_stored_author(sender, instance, raw=False, update_fields=None,
+                           **kwargs):
+    """Автора рецепта меняют в админке."""
+    instance.stored_author_id = None
+    if (raw or instance._state.adding or update_fields is not None
+            and not {'author', 'author_id'} & set(update_fields)):
+        return
+    instance.stored_author_id = Recipe.objects.filter(
+        pk=instance.pk).values_list('author_id', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def change_recipes_count(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        change_counter(User.objects.filter(pk=instance.author_id),
+                       'recipes_count', 1)
+    elif instance.stored_author_id not in (None, instance.author_id):
+        change_counter(User.objects.filter(pk=instance.author_id),
+                       'recipes_count', 1)
+        change_counter(User.objects.filter(pk=instance.stored_author_id),
+                       'recipes_count', -1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_counter(User.objects.filter(pk=instance.author_id),
+                   'recipes_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_cart_totals(sender, instance, created, raw=False,
+                                **kwargs):
+    if created and not raw:
+        ShoppingCartTotal.objects.add_recipe(
+            [instance.user_id], instance.recipe_id)
+        ShoppingCart.mark_changed(id=instance.user_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_cart_totals(sender, instance, **kwargs):
+    """
+    Из API, админки и каскадом при удалении рецепта или пользователя.
+    При каскаде ингредиенты рецепта ещё не удалены, либо их удаление уже
+    убрало рецепт из итогов этой корзины.
+    """
+    ShoppingCartTotal.objects.add_recipe(
+        [instance.user_id], instance.recipe_id, sign=-1)
+    ShoppingCart.mark_changed(id=instance.user_id)
+
+
+@receiver((pre_save, pre_delete), sender=IngredientRecipe)
+def remember_stored_amount(sender, instance, raw=False, **kwargs):
+    """
+    Ингредиент и количество из БД: форма админки меняет объект и перед
+    удалением.
+    """
+    instance.stored_amount = None
+    if not raw and not instance._state.adding:
+        instance.stored_amount = IngredientRecipe.objects.filter(
+            pk=instance.pk).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientRecipe)
+def change_shopping_cart_totals(sender, instance, raw=False, **kwargs):
+    """
+    Правка ингредиентов в админке. API пишет их через bulk_create и
+    bulk_update без сигналов и меняет итоги само.
+    """
+    if raw:
+        return
+    deltas = Counter({instance.ingredient_id: instance.amount})
+    if instance.stored_amount is not None:
+        ingredient_id, amount = instance.stored_amount
+        deltas[ingredient_id] -= amount
+    ShoppingCartTotal.objects.change_recipe(instance.recipe_id, deltas)
+
+
+@receiver(post_delete, sender=IngredientRecipe)
+def remove_ingredient_from_totals(sender, instance, **kwargs):
+    if instance.stored_amount is not None:
+        ingredient_id, amount = instance.stored_amount
+        ShoppingCartTotal.objects.change_recipe(
+            instance.recipe_id, {ingredient_id: -amount})
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Recipe)
+def process_images(sender, instance, **kwargs):
+    """Уменьшенные копии новой картинки готовятся вне запроса."""
+    images.schedule(instance)
@@ -1,13 +1,1211 @@
+import asyncio
+import base64
+import json
+import re
+import time
 from http import HTTPStatus
+from io import BytesIO, StringIO
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from threading import current_thread
+from types import SimpleNamespace
+from unittest import mock
 
-from django.test import Client, TestCase
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.backends.postgresql import base as postgresql_base
+from django.db.models import CharField, Q, Value
+from django.http import HttpResponse, QueryDict
+from django.test import (AsyncClient, Client, RequestFactory, SimpleTestCase,
+                         TestCase, override_settings)
+from foodgram_backend.postgresql.base import ConnectionPool, DatabaseWrapper
+from PIL import Image
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+
+from .async_views import async_view
+from .constants import (IMAGE_MAX_DIMENSION, IMAGE_UPLOAD_MAX_SIZE,
+                        RECIPE_IMAGE_VARIANTS)
+from .fields import StreamingBase64ImageField
+from .filters import RecipesFilter
+from .management.commands.load_test import Command as LoadTestCommand
+from .models import (FavoriteRecipe, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, ShoppingCartTotal, Subscription, Tag, User)
+from .performance import fingerprint
+from .reference_cache import ingredients_cache, tags_cache
+from .search import TrigramWordSimilar
+from .serializers import WriteRecipeSerializer
+from .throttling import ScopedBucketThrottle, TokenBucketThrottle
+
+
+def setUpModule():
+    cache.clear()  # Счётчики лимитов и кэши прошлых запусков
 
 
 class RecipesAPITestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
 
     def test_list_exists(self):
         """Проверка доступности списка рецептов."""
         response = self.guest_client.get('/api/recipes/')
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class RecipesQueryCountTestCase(TestCase):
+    RECIPES_COUNT = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Reader', last_name='Reader', password='pass')
+        tags = [Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}')
+                for i in range(3)]
+        ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)]
+        for i in range(cls.RECIPES_COUNT):
+            author = User.objects.create_user(
+                email=f'author{i}@example.com', username=f'author{i}',
+                first_name='Author', last_name='Author', password='pass')
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {i}', text='Текст', cooking_time=5,
+                author=author, image='recipes/images/test.png')
+            recipe.tags.set(tags)
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=i + 1)
+                for ingredient in ingredients)
+            if i % 2:
+                FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()  # Иначе гостю ответ отдаст кэш без запросов к БД
+        self.guest_client = Client()
+        self.auth_client = Client(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_list_query_count_does_not_depend_on_limit(self):
+        """Число запросов к списку рецептов не зависит от limit."""
+        # Без кэша: count, id страницы, рецепты с автором, теги, ингредиенты
+        # (+ токен и флаги). С кэшем фрагментов и токенов читателю нужны
+        # только count, id и флаги, а гостю отвечает кэш ответов.
+        for client, cold, warm in ((self.guest_client, 5, 0),
+                                   (self.auth_client, 7, 3)):
+            for limit in (1, self.RECIPES_COUNT):
+                cache.clear()
+                for queries in (cold, warm):
+                    with self.subTest(limit=limit, queries=queries), \
+                            self.assertNumQueries(queries):
+                        response = client.get(f'/api/recipes/?limit={limit}')
+                    self.assertEqual(response.status_code, HTTPStatus.OK)
+                    self.assertEqual(len(response.json()['results']), limit)
+
+    def test_list_user_flags(self):
+        """Флаги is_favorited/is_in_shopping_cart считаются для читателя."""
+        author = Recipe.objects.first().author
+        Subscription.objects.create(user=self.user, author=author)
+        self.guest_client.get(f'/api/recipes/?limit={self.RECIPES_COUNT}')
+        response = self.auth_client.get(
+            f'/api/recipes/?limit={self.RECIPES_COUNT}')
+        favorited = set(FavoriteRecipe.objects.filter(
+            user=self.user).values_list('recipe_id', flat=True))
+        for recipe in response.json()['results']:
+            self.assertEqual(recipe['is_favorited'],
+                             recipe['id'] in favorited)
+            self.assertEqual(recipe['is_in_shopping_cart'],
+                             recipe['id'] in favorited)
+            self.assertEqual(recipe['author']['is_subscribed'],
+                             recipe['author']['id'] == author.id)
+            self.assertTrue(recipe['image'].startswith('http://'))
+            self.assertEqual(len(recipe['ingredients']), 3)
+
+    def test_recipe_without_image(self):
+        """Рецепт без картинки отдаётся с image: null."""
+        recipe = Recipe.objects.create(
+            name='Без картинки', text='Текст', cooking_time=5,
+            author=self.user)
+        for client in (self.guest_client, self.auth_client):
+            with self.subTest(client=client):
+                self.assertIsNone(client.get(
+                    f'/api/recipes/{recipe.id}/').json()['image'])
+                self.assertIsNone(client.get(
+                    '/api/recipes/').json()['results'][0]['image'])
+
+
+class WriteRecipeValidationTestCase(TestCase):
+    INGREDIENTS_COUNT = 40
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(cls.INGREDIENTS_COUNT))
+        cls.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True))
+
+    def get_data(self, tags, ingredient_ids):
+        return {'tags': tags,
+                'ingredients': [{'id': pk, 'amount': 1}
+                                for pk in ingredient_ids],
+                'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 5}
+
+    def test_validation_query_count(self):
+        """Проверка существования: один запрос на модель."""
+        serializer = WriteRecipeSerializer(
+            data=self.get_data([self.tag.id], self.ingredient_ids))
+        with self.assertNumQueries(2):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_validation_reports_every_missing_id(self):
+        """В ошибке перечислены все несуществующие id."""
+        missing = max(self.ingredient_ids) + 1
+        serializer = WriteRecipeSerializer(data=self.get_data(
+            [self.tag.id], self.ingredient_ids + [missing, missing + 1]))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn(f'{missing}, {missing + 1}',
+                      str(serializer.errors['non_field_errors']))
+        serializer = WriteRecipeSerializer(data=self.get_data(
+            [self.tag.id, self.tag.id + 1], self.ingredient_ids))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn(str(self.tag.id + 1),
+                      str(serializer.errors['non_field_errors']))
+
+    def test_update_writes_only_ingredient_diff(self):
+        """При обновлении строки ингредиентов не пересоздаются."""
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Author', last_name='Author', password='pass')
+        recipe = Recipe.objects.create(
+            name='Рецепт', text='Текст', cooking_time=5, author=author,
+            image='recipes/images/test.png')
+        first, second, third, fourth = self.ingredient_ids[:4]
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in ((first, 1), (second, 2), (third, 3)))
+        kept = dict(recipe.recipe_ingredients.filter(
+            ingredient_id__in=(first, second)).values_list(
+                'ingredient_id', 'id'))
+        data = self.get_data([self.tag.id], [first, second, fourth])
+        data['ingredients'][1]['amount'] = 5
+        serializer = WriteRecipeSerializer(recipe, data=data, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        stored = {item.ingredient_id: item
+                  for item in recipe.recipe_ingredients.all()}
+        self.assertEqual(set(stored), {first, second, fourth})
+        self.assertEqual(stored[first].id, kept[first])
+        self.assertEqual(stored[second].id, kept[second])
+        self.assertEqual(stored[second].amount, 5)
+
+
+class DownloadShoppingCartTestCase(TestCase):
+    URL = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Cook', last_name='Cook', password='pass')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        salt_spoon = Ingredient.objects.create(
+            name='соль крупная', measurement_unit='ст. л.')
+        for amount in (2, 3):
+            recipe = Recipe.objects.create(
+                name='Рецепт', text='Текст', cooking_time=5, author=cls.user,
+                image='recipes/images/test.png')
+            IngredientRecipe.objects.bulk_create((
+                IngredientRecipe(recipe=recipe, ingredient=salt,
+                                 amount=amount),
+                IngredientRecipe(recipe=recipe, ingredient=salt_spoon,
+                                 amount=1)))
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.recipe = recipe
+        ShoppingCartTotal.objects.rebuild()
+        ShoppingCart.mark_changed(id=cls.user.id)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_formats(self):
+        """Список покупок группируется по названию и единице измерения."""
+        response = self.client.get(self.URL, {'format': 'csv'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines()[1:],
+                         ['соль,г,5', 'соль крупная,ст. л.,2'])
+        response = self.client.get(self.URL)
+        self.assertIn('соль', b''.join(response.streaming_content).decode())
+        response = self.client.get(self.URL, {'format': 'pdf'})
+        self.assertTrue(b''.join(response.streaming_content).startswith(
+            b'%PDF'))
+        response = self.client.get(self.URL, {'format': 'doc'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    @override_settings(ASYNC_VIEWS=True)
+    def test_asgi(self):
+        """Под ASGI ответ перебирается в цикле событий, где ORM нельзя."""
+        async def download():
+            response = await AsyncClient().get(
+                f'{self.URL}?format=csv',
+                authorization=f'Token {self.token.key}')
+            # Как ASGIHandler.send_response: тело читается в цикле событий
+            return response.status_code, b''.join(response)
+
+        status, content = async_to_sync(download)()
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual(content.decode().splitlines()[1:],
+                         ['соль,г,5', 'соль крупная,ст. л.,2'])
+
+    def test_not_modified(self):
+        """Повторная загрузка с ETag не выполняет агрегацию."""
+        etag = self.client.get(self.URL)['ETag']
+        with self.assertNumQueries(1):  # Только аутентификация
+            response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.client.delete(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_totals_follow_cart_and_recipe_changes(self):
+        """Итоги списка покупок совпадают с пересчётом по корзинам."""
+        other = Recipe.objects.create(
+            name='Другой', text='Текст', cooking_time=5, author=self.user,
+            image='recipes/images/test.png')
+        IngredientRecipe.objects.create(
+            recipe=other, ingredient=Ingredient.objects.get(name='соль'),
+            amount=7)
+        self.client.post(f'/api/recipes/{other.id}/shopping_cart/')
+        call_command('rebuild_shopping_cart_totals', '--verify',
+                     stdout=StringIO())
+        salt_spoon = Ingredient.objects.get(name='соль крупная')
+        data = {'ingredients': [{'id': salt_spoon.id, 'amount': 4}],
+                'tags': [Tag.objects.create(name='Обед', slug='lunch').id],
+                'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 5}
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/', data,
+            content_type='application/json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        call_command('rebuild_shopping_cart_totals', '--verify',
+                     stdout=StringIO())
+        self.client.delete(f'/api/recipes/{other.id}/shopping_cart/')
+        self.client.delete(f'/api/recipes/{self.recipe.id}/')
+        call_command('rebuild_shopping_cart_totals', '--verify',
+                     stdout=StringIO())
+        self.assertEqual(
+            dict(ShoppingCartTotal.objects.values_list(
+                'ingredient__name', 'amount')),
+            {'соль': 2, 'соль крупная': 1})
+
+    def test_totals_follow_author_deletion(self):
+        """Рецепты удалённого автора уходят из чужих списков покупок."""
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Author', last_name='Author', password='pass')
+        recipe = Recipe.objects.create(
+            name='Чужой', text='Текст', cooking_time=5, author=author,
+            image='recipes/images/test.png')
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=Ingredient.objects.get(name='соль'),
+            amount=5)
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        ShoppingCart.objects.create(user=author, recipe=self.recipe)
+        etag = self.client.get(self.URL)['ETag']
+        response = Client(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=author)}'
+        ).delete('/api/users/me/', {'current_password': 'pass'},
+                 content_type='application/json')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        call_command('rebuild_shopping_cart_totals', '--verify',
+                     stdout=StringIO())
+        response = self.client.get(self.URL, {'format': 'csv'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            b''.join(response.streaming_content).decode().splitlines()[1:],
+            ['соль,г,5', 'соль крупная,ст. л.,2'])
+
+    def test_totals_follow_admin_changes(self):
+        """Правка ингредиентов и удаление рецепта в админке меняют итоги."""
+        admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin',
+            first_name='Admin', last_name='Admin', password='pass')
+        self.client.force_login(admin)
+        items = list(self.recipe.recipe_ingredients.all())
+        data = {
+            'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 5,
+            'author': self.user.id,
+            'tags': Tag.objects.create(name='Обед', slug='lunch').id,
+            'recipe_ingredients-TOTAL_FORMS': len(items),
+            'recipe_ingredients-INITIAL_FORMS': len(items),
+            'recipe_ingredients-MIN_NUM_FORMS': 0,
+            'recipe_ingredients-MAX_NUM_FORMS': 1000,
+        }
+        for i, item in enumerate(items):
+            data.update({
+                f'recipe_ingredients-{i}-id': item.id,
+                f'recipe_ingredients-{i}-recipe': self.recipe.id,
+                f'recipe_ingredients-{i}-ingredient': item.ingredient_id,
+                f'recipe_ingredients-{i}-amount': item.amount + 10,
+            })
+        data['recipe_ingredients-1-DELETE'] = 'on'
+        url = f'/admin/api/recipe/{self.recipe.id}/change/'
+        self.assertEqual(self.client.post(url, data).status_code,
+                         HTTPStatus.FOUND)
+        call_command('rebuild_shopping_cart_totals', '--verify',
+                     stdout=StringIO())
+        self.client.post(f'/admin/api/recipe/{self.recipe.id}/delete/',
+                         {'post': 'yes'})
+        self.assertFalse(Recipe.objects.filter(pk=self.recipe.pk).exists())
+        call_command('rebuild_shopping_cart_totals', '--verify',
+                     stdout=StringIO())
+
+
+class SubscriptionsTestCase(TestCase):
+    URL = '/api/users/subscriptions/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Reader', last_name='Reader', password='pass')
+        cls.authors = []
+        for i in range(3):
+            author = User.objects.create_user(
+                email=f'author{i}@example.com', username=f'author{i}',
+                first_name='Author', last_name='Author', password='pass')
+            for j in range(i + 2):
+                Recipe.objects.create(
+                    name=f'Рецепт {i}-{j}', text='Текст', cooking_time=5,
+                    author=author, image='recipes/images/test.png')
+            Subscription.objects.create(user=cls.user, author=author)
+            cls.authors.append(author)
+        call_command('reconcile_counters', stdout=StringIO())
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_each_author_gets_own_recipes(self):
+        """У каждого автора свои рецепты, не больше recipes_limit."""
+        response = self.client.get(self.URL, {'recipes_limit': 2})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        for author in response.json()['results']:
+            recipes = Recipe.objects.filter(author_id=author['id'])
+            self.assertEqual(author['recipes_count'], recipes.count())
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']],
+                list(recipes.order_by('-pub_date', '-id').values_list(
+                    'id', flat=True)[:2]))
+
+    def test_query_count_does_not_depend_on_authors(self):
+        """Страница подписок: count, авторы, рецепты, подписки."""
+        self.client.get(self.URL)  # Снимок пользователя попадает в кэш
+        for limit in (1, len(self.authors)):
+            with self.subTest(limit=limit), self.assertNumQueries(4):
+                response = self.client.get(
+                    self.URL, {'limit': limit, 'recipes_limit': 1})
+            self.assertTrue(all(
+                author['is_subscribed']
+                for author in response.json()['results']))
+
+    def test_is_subscribed_depends_on_viewer(self):
+        """is_subscribed у автора рецепта считается для читателя."""
+        recipe = Recipe.objects.filter(author=self.authors[0]).first()
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertTrue(response.json()['author']['is_subscribed'])
+        response = Client().get(f'/api/recipes/{recipe.id}/')
+        self.assertFalse(response.json()['author']['is_subscribed'])
+
+    def test_invalid_recipes_limit(self):
+        response = self.client.get(self.URL, {'recipes_limit': 'abc'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        author = User.objects.create_user(
+            email='new@example.com', username='new',
+            first_name='New', last_name='Author', password='pass')
+        response = self.client.post(
+            f'/api/users/{author.id}/subscribe/?recipes_limit=abc')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertFalse(Subscription.objects.filter(author=author).exists())
+
+
+class CountersTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Reader', last_name='Reader', password='pass')
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Author', last_name='Author', password='pass')
+        cls.recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {i}', text='Текст', cooking_time=5,
+                author=cls.author, image='recipes/images/test.png')
+            for i in range(2)]
+        call_command('reconcile_counters', stdout=StringIO())
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются вместе со связями и совпадают с пересчётом."""
+        first, second = self.recipes
+        self.client.post(f'/api/recipes/{first.id}/favorite/')
+        self.client.post(f'/api/recipes/{second.id}/favorite/')
+        self.client.post(f'/api/recipes/{first.id}/shopping_cart/')
+        self.client.delete(f'/api/recipes/{second.id}/favorite/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        call_command('reconcile_counters', '--verify', stdout=StringIO())
+        first.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (first.favorites_count, first.shopping_cart_count), (1, 1))
+        self.assertEqual(
+            (self.author.recipes_count, self.author.subscribers_count),
+            (2, 1))
+        response = self.client.get('/api/recipes/?ordering=-favorites_count')
+        self.assertEqual(response.json()['results'][0]['id'], first.id)
+        second.author = self.user  # Как в админке
+        second.save()
+        call_command('reconcile_counters', '--verify', stdout=StringIO())
+
+    def test_counters_follow_user_deletion(self):
+        """Каскадное удаление связей пользователя уменьшает счётчики."""
+        first = self.recipes[0]
+        self.client.post(f'/api/recipes/{first.id}/favorite/')
+        self.client.post(f'/api/recipes/{first.id}/shopping_cart/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        response = self.client.delete(
+            '/api/users/me/', {'current_password': 'pass'},
+            content_type='application/json')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        call_command('reconcile_counters', '--verify', stdout=StringIO())
+        first.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (first.favorites_count, first.shopping_cart_count,
+             self.author.subscribers_count), (0, 0, 0))
+        self.author.delete()
+        call_command('reconcile_counters', '--verify', stdout=StringIO())
+
+    def test_reconcile_repairs_drift(self):
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(
+            favorites_count=10)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_counters', '--verify', stdout=StringIO())
+        call_command('reconcile_counters', stdout=StringIO())
+        call_command('reconcile_counters', '--verify', stdout=StringIO())
+
+    def test_save_keeps_concurrent_counters(self):
+        """Сохранение прочитанного раньше объекта не затирает счётчики."""
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        author = User.objects.get(pk=self.author.pk)
+        self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.client.post(f'/api/users/{author.id}/subscribe/')
+        recipe.name = 'Новое название'
+        recipe.save()
+        author.first_name = 'Автор'
+        author.save()
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(
+            (recipe.name, recipe.favorites_count), ('Новое название', 1))
+        self.assertEqual(author.subscribers_count, 1)
+
+
+class IngredientSearchTestCase(TestCase):
+    URL = '/api/ingredients/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('варенье', 'абрикосовое варенье', 'вареники',
+                     'сахар', 'ванилин'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        ingredients_cache.invalidate()
+
+    def search(self, term):
+        response = self.client.get(self.URL, {'name': term})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_then_contains_then_fuzzy(self):
+        self.assertEqual(self.search('ва'), ['ванилин', 'вареники', 'варенье'])
+        self.assertEqual(self.search('Варенье'),
+                         ['варенье', 'абрикосовое варенье', 'вареники'])
+        self.assertEqual(self.search('варене'),
+                         ['варенье', 'вареники', 'абрикосовое варенье'])
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self.search('мёд'), [])
+        Ingredient.objects.create(name='мёд', measurement_unit='г')
+        self.assertEqual(self.search('мёд'), ['мёд'])
+
+    def test_word_similarity_is_local(self):
+        self.assertNotIn('trigram_word_similar', CharField.get_lookups())
+        queryset = Ingredient.objects.filter(
+            Q(TrigramWordSimilar('name', Value('варене'))))
+        self.assertIn('"name" %> варене', str(queryset.query))
+
+
+class ReferenceCacheTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+
+    def setUp(self):
+        tags_cache.invalidate()
+
+    def test_tags_served_without_queries(self):
+        """Теги отдаются из снимка без запросов, с ETag и 304."""
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/')
+            detail = self.client.get(f'/api/tags/{self.tag.id}/')
+        self.assertEqual(response.json(), [
+            {'id': self.tag.id, 'name': 'Завтрак', 'slug': 'breakfast'}])
+        self.assertEqual(detail.json()['slug'], 'breakfast')
+        response = self.client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        response = self.client.get('/api/tags/0/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_snapshot_follows_changes(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        Tag.objects.create(name='Обед', slug='lunch')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.json()), 2)
+
+
+class ImportIngredientsTestCase(TestCase):
+
+    def import_file(self, content, suffix, *args):
+        with NamedTemporaryFile('w', suffix=suffix, encoding='utf-8') as file:
+            file.write(content)
+            file.flush()
+            call_command('import_ingredients', file.name, *args,
+                         stdout=StringIO())
+
+    def test_import_csv_and_json(self):
+        """Импорт нормализует названия и не дублирует ингредиенты."""
+        self.import_file('Соль ,г\nсахар,г\n,г\n', '.csv')
+        self.import_file(
+            '[{"name": "соль", "measurement_unit": "кг"},'
+            ' {"name": "Мёд", "measurement_unit": "г"}]', '.json',
+            '--dry-run')
+        self.assertEqual(
+            dict(Ingredient.objects.values_list('name', 'measurement_unit')),
+            {'соль': 'г', 'сахар': 'г'})
+        self.import_file(
+            '[{"name": "соль", "measurement_unit": "кг"},'
+            ' {"name": "Мёд", "measurement_unit": "г"}]', '.json',
+            '--update', '--batch-size', '1')
+        self.assertEqual(
+            dict(Ingredient.objects.values_list('name', 'measurement_unit')),
+            {'соль': 'кг', 'сахар': 'г', 'мёд': 'г'})
+
+
+class RecipePaginationTestCase(TestCase):
+    RECIPES_COUNT = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Author', last_name='Author', password='pass')
+        for i in range(cls.RECIPES_COUNT):
+            Recipe.objects.create(
+                name=f'Рецепт {i}', text='Текст', cooking_time=5,
+                author=author, image='recipes/images/test.png')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages_cover_feed(self):
+        """Курсорные страницы проходят ленту без повторов и пропусков."""
+        ids = []
+        url = '/api/recipes/?pagination=cursor&limit=3'
+        while url:
+            response = self.client.get(url).json()
+            self.assertNotIn('count', response)
+            ids.extend(recipe['id'] for recipe in response['results'])
+            url = response['next']
+        self.assertEqual(ids, list(Recipe.objects.order_by(
+            '-pub_date', '-id').values_list('id', flat=True)))
+
+    def test_without_count(self):
+        """count=none не выполняет COUNT(*), но отдаёт ссылку дальше."""
+        # id страницы, рецепты, теги, ингредиенты
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                '/api/recipes/', {'count': 'none', 'limit': 3, 'offset': 3})
+        response = response.json()
+        self.assertIsNone(response['count'])
+        self.assertIn('offset=6', response['next'])
+        response = self.client.get(
+            '/api/recipes/', {'count': 'none', 'limit': 3, 'offset': 6})
+        self.assertIsNone(response.json()['next'])
+        count = self.client.get(
+            '/api/recipes/', {'count': 'estimate', 'limit': 3}).json()['count']
+        self.assertIsInstance(count, int)
+        if connection.vendor != 'postgresql':  # Иначе оценка по статистике
+            self.assertEqual(count, self.RECIPES_COUNT)
+
+    def test_cursor_rejects_ordering(self):
+        response = self.client.get(
+            '/api/recipes/',
+            {'pagination': 'cursor', 'ordering': '-favorites_count'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('ordering', response.json())
+
+
+class ResponseCacheTestCase(TestCase):
+    BACKENDS = (
+        {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+         'LOCATION': '/tmp/foodgram_test_cache'},
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Author', last_name='Author', password='pass')
+        cls.other = User.objects.create_user(
+            email='other@example.com', username='other',
+            first_name='Other', last_name='Other', password='pass')
+        cls.recipe, cls.other_recipe = (
+            Recipe.objects.create(
+                name=f'Рецепт {author.username}', text='Текст',
+                cooking_time=5, author=author,
+                image='recipes/images/test.png')
+            for author in (cls.author, cls.other))
+
+    def test_cache_hit_and_invalidation(self):
+        """Правка рецепта сбрасывает только зависящие от него ответы."""
+        feed = '/api/recipes/'
+        own = f'/api/recipes/{self.recipe.id}/'
+        other = f'/api/recipes/{self.other_recipe.id}/'
+        other_feed = f'/api/recipes/?author={self.other.id}'
+        for backend in self.BACKENDS:
+            with self.subTest(backend=backend['BACKEND']), \
+                    override_settings(CACHES={'default': backend}):
+                cache.clear()
+                for url in (feed, own, other, other_feed):
+                    self.client.get(url)
+                    with self.assertNumQueries(0):
+                        self.assertEqual(
+                            self.client.get(url).status_code, HTTPStatus.OK)
+                WriteRecipeSerializer().update(
+                    Recipe.objects.get(pk=self.recipe.pk),
+                    {'name': 'Новое название'})
+                for url in (other, other_feed):
+                    with self.assertNumQueries(0):
+                        self.client.get(url)
+                self.assertEqual(self.client.get(own).json()['name'],
+                                 'Новое название')
+                self.assertEqual(
+                    self.client.get(feed).json()['results'][-1]['name'],
+                    'Новое название')
+
+    def test_model_changes_invalidate(self):
+        """Сохранение и удаление модели (админка) тоже сбрасывают кэш."""
+        cache.clear()
+        own = f'/api/recipes/{self.recipe.id}/'
+        self.client.get(own)
+        self.client.get('/api/recipes/')
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        recipe.name = 'Из админки'
+        recipe.save()
+        self.assertEqual(self.client.get(own).json()['name'], 'Из админки')
+        recipe.delete()
+        self.assertEqual(self.client.get(own).status_code,
+                         HTTPStatus.NOT_FOUND)
+        self.assertEqual(self.client.get('/api/recipes/').json()['count'], 1)
+
+
+class ImageVariantsTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(
+            MEDIA_ROOT=media.name, IMAGE_PROCESSING_ASYNC=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_variants_built_after_commit(self):
+        """После коммита готовятся копии, и API отдаёт их вместо оригинала."""
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Author', last_name='Author', password='pass')
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(buffer, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                name='Рецепт', text='Текст', cooking_time=5, author=author,
+                image=ContentFile(buffer.getvalue(), 'dish.png'))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants['source'], recipe.image.name)
+        for variant, size in RECIPE_IMAGE_VARIANTS.items():
+            with recipe.image.storage.open(
+                    recipe.image_variants[variant]) as file, \
+                    Image.open(file) as image:
+                self.assertEqual(image.size, (size, size // 2))
+        response = self.client.get(f'/api/recipes/{recipe.id}/').json()
+        self.assertTrue(response['image'].endswith(
+            recipe.image_variants['medium']))
+
+
+class StreamingBase64ImageFieldTestCase(TestCase):
+
+    @staticmethod
+    def encode(image, image_format='PNG'):
+        buffer = BytesIO()
+        image.save(buffer, image_format)
+        return (f'data:image/{image_format.lower()};base64,'
+                + base64.b64encode(buffer.getvalue()).decode())
+
+    def test_valid_image(self):
+        file = StreamingBase64ImageField().to_internal_value(
+            self.encode(Image.new('RGB', (300, 200)), 'JPEG'))
+        self.assertTrue(file.name.endswith('.jpg'))
+        with Image.open(file) as image:
+            self.assertEqual(image.size, (300, 200))
+
+    def test_wrapped_base64(self):
+        """Переносы строк (MIME, 76 символов) не мешают декодированию."""
+        data = self.encode(Image.effect_noise((300, 300), 64), 'PNG')
+        header, encoded = data.split(',')
+        wrapped = '\r\n'.join(
+            encoded[i:i + 76] for i in range(0, len(encoded), 76))
+        file = StreamingBase64ImageField().to_internal_value(
+            f'{header},{wrapped}')
+        self.assertEqual(file.read(), base64.b64decode(encoded))
+
+    def test_rejected_payloads(self):
+        field = StreamingBase64ImageField()
+        for data, code in (
+            ('A' * (IMAGE_UPLOAD_MAX_SIZE // 3 * 4 + 8), 'too_large'),
+            (self.encode(Image.new('1', (IMAGE_MAX_DIMENSION + 1, 1))),
+             'too_big_dimensions'),
+            (self.encode(Image.new('1', (IMAGE_MAX_DIMENSION,) * 2)),
+             'too_many_pixels'),
+            (self.encode(Image.new('RGB', (10, 10)), 'BMP'),
+             'invalid_format'),
+            ('data:image/png;base64,not base64!', 'invalid_base64'),
+        ):
+            with self.subTest(code=code), \
+                    self.assertRaises(ValidationError) as error:
+                field.to_internal_value(data)
+            self.assertEqual(error.exception.detail[0].code, code)
+
+
+class AsyncViewTestCase(SimpleTestCase):
+
+    def test_view_runs_in_pool(self):
+        """Синхронный view выполняется в пуле потоков ORM, а не в цикле."""
+        def view(request):
+            return HttpResponse(current_thread().name)
+
+        wrapped = async_view(view)
+        self.assertTrue(asyncio.iscoroutinefunction(wrapped))
+        response = async_to_sync(wrapped)(RequestFactory().get('/'))
+        self.assertTrue(response.content.startswith(b'orm'))
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+
+    class Connection:
+        closed = False
+        info = SimpleNamespace(transaction_status=TRANSACTION_STATUS_IDLE)
+
+        def close(self):
+            self.closed = True
+
+    def test_reuse_and_limit(self):
+        """Возвращённое соединение переиспользуется, сверх лимита — ошибка."""
+        pool = ConnectionPool(max_size=2, timeout=0.01)
+        first, reused = pool.get(self.Connection)
+        self.assertFalse(reused)
+        pool.get(self.Connection)
+        with self.assertRaises(OperationalError):
+            pool.get(self.Connection)
+        pool.put(first)
+        self.assertEqual(pool.get(self.Connection), (first, True))
+        pool.put(first, discard=True)
+        self.assertTrue(first.closed)
+        self.assertFalse(pool.get(self.Connection)[1])
+
+    def test_new_connection_skips_health_check(self):
+        """Соединение, открытое в запросе, не проверяется SELECT 1."""
+        wrapper = DatabaseWrapper({
+            'NAME': 'foodgram', 'USER': '', 'PASSWORD': '', 'HOST': '',
+            'PORT': '', 'OPTIONS': {}, 'CONN_MAX_AGE': 60,
+            'CONN_HEALTH_CHECKS': True, 'AUTOCOMMIT': True,
+            'TIME_ZONE': None})
+        with mock.patch.object(
+                postgresql_base.DatabaseWrapper, 'get_new_connection',
+                return_value=self.Connection()):
+            wrapper.get_new_connection({})
+        self.assertTrue(wrapper.health_check_done)
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Reader', last_name='Reader', password='pass')
+
+    def setUp(self):
+        cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_snapshot_without_queries(self):
+        self.client.get('/api/users/me/')
+        with self.assertNumQueries(1):  # Только подписки для is_subscribed
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.json()['username'], 'reader')
+
+    def test_logout_and_deactivation(self):
+        """Выход и деактивация действуют сразу, несмотря на кэш."""
+        self.client.get('/api/users/me/')
+        self.client.post('/api/auth/token/logout/')
+        self.assertEqual(self.client.get('/api/users/me/').status_code,
+                         HTTPStatus.UNAUTHORIZED)
+        token = Token.objects.create(user=self.user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        client.get('/api/users/me/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(client.get('/api/users/me/').status_code,
+                         HTTPStatus.UNAUTHORIZED)
+
+    def test_password_change(self):
+        self.client.get('/api/users/me/')
+        self.client.post('/api/users/set_password/', {
+            'current_password': 'pass', 'new_password': 'NewPass-2024'})
+        with self.assertNumQueries(2):  # Снимок собирается заново
+            self.client.get('/api/users/me/')
+
+
+class ThrottlingTestCase(TestCase):
+
+    def test_token_bucket(self):
+        """Ведро из трёх запросов пополняется по одному за 20 секунд."""
+        cache.clear()
+        rates = {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'],
+                 'search': '3/minute'}
+        now = [1000.0]
+        with override_settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates,
+        }), mock.patch.object(
+            TokenBucketThrottle, 'timer', staticmethod(lambda: now[0]),
+        ):
+            for expected in (HTTPStatus.OK,) * 3 + (
+                    HTTPStatus.TOO_MANY_REQUESTS,):
+                response = self.client.get('/api/ingredients/')
+                self.assertEqual(response.status_code, expected)
+            self.assertEqual(response['Retry-After'], '20')
+            now[0] += 40  # Отклонённый запрос тоже занял интервал
+            self.assertEqual(self.client.get('/api/ingredients/').status_code,
+                             HTTPStatus.OK)
+            self.assertEqual(self.client.get('/api/ingredients/').status_code,
+                             HTTPStatus.TOO_MANY_REQUESTS)
+
+    def test_bucket_outlives_default_timeout(self):
+        """Суточный лимит не сбрасывается через 300 секунд простоя."""
+        cache.clear()
+        rates = {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'],
+                 'search': '3/day'}
+        now = [time.time()]
+        with override_settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates,
+        }), mock.patch.object(
+            TokenBucketThrottle, 'timer', staticmethod(lambda: now[0]),
+        ), mock.patch('time.time', lambda: now[0]):  # Сроки жизни в кэше
+            for _ in range(3):
+                self.client.get('/api/ingredients/')
+            now[0] += 301
+            self.assertEqual(self.client.get('/api/ingredients/').status_code,
+                             HTTPStatus.TOO_MANY_REQUESTS)
+
+    def test_search_within_rate(self):
+        """Поиск ингредиентов в пределах лимита scope search отвечает 200."""
+        cache.clear()
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        num_requests, _ = ScopedBucketThrottle().parse_rate(
+            settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']['search'])
+        with mock.patch.object(TokenBucketThrottle, 'timer',
+                               staticmethod(lambda: 1000.0)):
+            for _ in range(num_requests):
+                response = self.client.get('/api/ingredients/?name=со')
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertEqual(response.json()[0]['name'], 'соль')
+            self.assertEqual(
+                self.client.get('/api/ingredients/?name=со').status_code,
+                HTTPStatus.TOO_MANY_REQUESTS)
+            with override_settings(THROTTLING_ENABLED=False):
+                self.assertEqual(
+                    self.client.get('/api/ingredients/?name=со').status_code,
+                    HTTPStatus.OK)
+
+
+class ShortLinksTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Author', last_name='Author', password='pass')
+        cls.recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {i}', text='Текст', cooking_time=5,
+                author=author, image='recipes/images/test.png')
+            for i in range(3)]
+
+    def test_redirect(self):
+        recipe = self.recipes[0]
+        link = self.client.get(
+            f'/api/recipes/{recipe.id}/get-link/').json()['short-link']
+        self.assertRegex(link, r'/s/[0-9a-zA-Z]{6}$')
+        path = link[link.index('/s/'):]
+        self.assertRedirects(self.client.get(path), f'/recipes/{recipe.id}',
+                             fetch_redirect_response=False)
+        with self.assertNumQueries(0):
+            self.client.get(path)
+            self.client.get('/s/zzzzzz')  # Перебор кодов тоже без БД
+            response = self.client.get('/s/000000')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        Recipe.objects.filter(pk=recipe.pk).update(short_code=None)
+        self.assertEqual(self.client.get(
+            f'/api/recipes/{recipe.id}/get-link/').json()['short-link'], link)
+
+    def test_backfill(self):
+        codes = {recipe.id: recipe.short_code for recipe in self.recipes}
+        self.assertEqual(len(set(codes.values())), len(codes))
+        Recipe.objects.update(short_code=None)
+        call_command('backfill_short_codes', '--batch-size', '2',
+                     stdout=StringIO())
+        self.assertEqual(
+            dict(Recipe.objects.values_list('id', 'short_code')), codes)
+
+
+class ServerTimingTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Author', last_name='Author', password='pass')
+        Recipe.objects.create(
+            name='Рецепт', text='Текст', cooking_time=5, author=author,
+            image='recipes/images/test.png')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT *\n FROM t WHERE id IN (%s, %s) LIMIT 21'),
+            'SELECT * FROM t WHERE id IN (...) LIMIT ?')
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_header_and_budget(self):
+        response = self.client.get('/api/recipes/')
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="[1-9]\d* queries", '
+            r'serializer;dur=[\d.]+, total;dur=[\d.]+$')
+        cache.clear()
+        with override_settings(PERFORMANCE_QUERY_BUDGET=0), self.assertLogs(
+                'api.performance', 'WARNING') as logs:
+            self.client.get('/api/recipes/')
+        self.assertIn('FROM "api_recipe"', logs.output[0])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/recipes/'))
+
+
+class MetricsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Author', last_name='Author', password='pass')
+        Recipe.objects.create(
+            name='Рецепт', text='Текст', cooking_time=5, author=author,
+            image='recipes/images/test.png')
+
+    def setUp(self):
+        cache.clear()
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            METRICS_ENABLED=True, METRICS_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory.name
+
+    def test_metrics(self):
+        self.client.get('/api/recipes/')
+        self.client.get('/api/recipes/')
+        self.client.get('/api/recipes/', HTTP_AUTHORIZATION='Token bad')
+        # Значения другого воркера суммируются с текущими
+        with open(f'{self.directory}/1.json', 'w') as file:
+            json.dump([['foodgram_auth_failures_total',
+                        [['reason', 'token']], 2]], file)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        content = response.content.decode()
+        for line in (
+            'foodgram_requests_total{action="list",method="GET",'
+            'status="200",view="RecipeViewSet"} 2',
+            'foodgram_requests_total{action="list",method="GET",'
+            'status="401",view="RecipeViewSet"} 1',
+            'foodgram_request_duration_seconds_count{action="list",'
+            'view="RecipeViewSet"} 3',
+            'foodgram_request_db_queries_bucket{action="list",'
+            'view="RecipeViewSet",le="+Inf"} 3',
+            'foodgram_cache_requests_total{cache="response",result="hit"} 1',
+            'foodgram_cache_requests_total{cache="response",result="miss"} 1',
+            'foodgram_auth_failures_total{reason="token"} 3',
+        ):
+            self.assertIn(line, content.splitlines())
+        self.assertIn('# TYPE foodgram_response_size_bytes histogram',
+                      content)
+
+
+class QueryPlanTestCase(TestCase):
+    """Страницы ленты с горячими фильтрами идут по нашим индексам."""
+
+    FEED = 'recipe_pub_date_id_idx'
+    AUTHOR = 'recipe_author_pub_date_idx'
+    FAVORITES = 'favoriterecipe_recipe_user_idx'
+    SHOPPING_CART = 'shoppingcart_recipe_user_idx'
+    # SQLite проверяет связь по уникальному индексу (user, recipe)
+    POSTGRESQL_ONLY = (FAVORITES, SHOPPING_CART)
+    FILTERS = (
+        ({'tags': ['tag0', 'tag1']}, (FEED,)),
+        ({'author': None}, (AUTHOR,)),
+        ({'is_favorited': '1'}, (FEED, FAVORITES)),
+        ({'is_favorited': '0'}, (FEED, FAVORITES)),
+        ({'is_in_shopping_cart': '1'}, (FEED, SHOPPING_CART)),
+        ({'is_in_shopping_cart': '0'}, (FEED, SHOPPING_CART)),
+        ({'author': None, 'tags': ['tag0']}, (AUTHOR,)),
+        ({'tags': ['tag1'], 'is_favorited': '1'}, (FEED, FAVORITES)),
+    )
+    PAGE_SIZE = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            User.objects.create_user(
+                email=f'user{i}@example.com', username=f'user{i}',
+                first_name='User', last_name='User', password='pass')
+            for i in range(10)]
+        tags = [Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}')
+                for i in range(5)]
+        Recipe.objects.bulk_create(
+            Recipe(name=f'Рецепт {i}', text='Текст', cooking_time=5,
+                   author=users[i % len(users)],
+                   image='recipes/images/test.png')
+            for i in range(2000))
+        recipes = list(Recipe.objects.all())
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tags[(i + shift) % 5])
+            for i, recipe in enumerate(recipes) for shift in range(2))
+        for model in (FavoriteRecipe, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe)
+                for user in users[1:] for recipe in recipes[::7])
+            # Пользователь с тысячами избранных рецептов и покупок
+            model.objects.bulk_create(
+                model(user=users[0], recipe=recipe) for recipe in recipes)
+        cls.user = users[1]
+        cls.heavy_user = users[0]  # Для него лента фильтруется целиком
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def get_plan(self, params):
+        query = QueryDict(mutable=True)
+        for key, value in params.items():
+            if isinstance(value, list):
+                query.setlist(key, value)
+            else:
+                query[key] = value or self.user.id
+        request = RequestFactory().get('/')
+        request.user = self.user
+        queryset = RecipesFilter(
+            query, queryset=Recipe.objects.all(), request=request).qs
+        return queryset[:self.PAGE_SIZE].explain()
+
+    def test_indexes_used(self):
+        for params, indexes in self.FILTERS:
+            with self.subTest(params=params):
+                plan = self.get_plan(params)
+                for index in indexes:
+                    if (connection.vendor == 'postgresql'
+                            or index not in self.POSTGRESQL_ONLY):
+                        self.assertIn(index, plan)
+                if connection.vendor == 'postgresql':
+                    self.assertNotIn('Seq Scan', plan)
+                    self.assertNotIn('Unique', plan)
+                else:  # SQLite: SCAN <таблица> без USING INDEX
+                    self.assertIsNone(
+                        re.search(r'SCAN (TABLE )?\w+\s*$', plan, re.M),
+                        plan)
+                    self.assertNotIn('DISTINCT', plan)
+
+    def test_no_duplicate_rows(self):
+        """Рецепт с несколькими выбранными тегами попадает в ленту один раз."""
+        token = Token.objects.create(user=self.heavy_user)
+        response = self.client.get('/api/recipes/', {
+            'tags': ['tag0', 'tag1'], 'is_favorited': 1, 'limit': 100},
+            HTTP_AUTHORIZATION=f'Token {token.key}')
+        ids = [recipe['id'] for recipe in response.json()['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(response.json()['count'], Recipe.objects.filter(
+            tags__slug__in=['tag0', 'tag1']).distinct().count())
+
+
+class LoadTestReportTestCase(SimpleTestCase):
+
+    def test_only_successful_responses_count(self):
+        """Ответы 429 и 5xx не входят в req/s и перцентили."""
+        command = LoadTestCommand(stdout=StringIO())
+        command.report(
+            'sync', ([0.01] * 20, [HTTPStatus.TOO_MANY_REQUESTS] * 70
+                     + [HTTPStatus.INTERNAL_SERVER_ERROR] * 5 + [None] * 5),
+            10)
+        output = command.stdout.getvalue()
+        self.assertIn('2.0 req/s (2xx)', output)
+        self.assertIn('throttled (429) 70, errors 10', output)
+        self.assertIn('80 of 100 requests failed', output)
+        with self.assertRaises(CommandError):
+            command.report('async', ([], [HTTPStatus.TOO_MANY_REQUESTS]), 10)
@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.core.cache.backends.base import BaseCache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+# Ведро может простаивать с запасом до 1/RESET_SLACK ёмкости, прежде чем
+# значение в кэше сбросится: так проверка почти всегда — один сдвиг
+RESET_SLACK = 10
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Token bucket на алгоритме GCRA. Для клиента в общем кэше хранится одно
+    число: теоретическое время следующего запроса (TAT, мс). Запрос
+    сдвигает его на интервал duration / num_requests и проходит, пока TAT
+    опережает текущее время не больше чем на duration.
+    Отклонённые запросы тоже сдвигают TAT: долбящий клиент ждёт дольше.
+    Сдвиг атомарен между воркерами только у кэшей со своим incr
+    (memcached); у файлового и БД-кэша это get и set, лимит приблизительный.
+    При THROTTLING_ENABLED=False лимиты не проверяются.
+    """
+
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    @property
+    def THROTTLE_RATES(self):
+        return api_settings.DEFAULT_THROTTLE_RATES  # Учитывает тесты
+
+    @property
+    def atomic_incr(self):
+        return self.cache.incr.__func__ is not BaseCache.incr
+
+    def shift(self, interval, timeout):
+        """
+        Сдвигаем TAT, None — ключа нет. BaseCache.incr записывает значение
+        с таймаутом по умолчанию, поэтому без своего incr пишем сами.
+        """
+        if self.atomic_incr:  # Срок жизни ключа не меняется
+            try:
+                return self.cache.incr(self.key, interval)
+            except ValueError:
+                return None
+        tat = self.cache.get(self.key)
+        if tat is None:
+            return None
+        self.cache.set(self.key, tat + interval, timeout)
+        return tat + interval
+
+    def allow_request(self, request, view):
+        if self.rate is None or not settings.THROTTLING_ENABLED:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        duration = self.duration * 1000
+        interval = max(1, duration // self.num_requests)
+        timeout = self.duration * 2
+        now = int(self.timer() * 1000)
+        tat = self.shift(interval, timeout)
+        if tat is None:  # Ключа нет: ведро полное
+            tat = now + interval
+            if not self.cache.add(self.key, tat, timeout):
+                tat = self.shift(interval, timeout) or tat
+        if tat - interval < now - duration // RESET_SLACK:
+            tat = now + interval  # Ведро давно полное: сбрасываем запас
+            self.cache.set(self.key, tat, timeout)
+        self.wait_time = (tat - now - duration) / 1000
+        return self.wait_time <= 0
+
+    def wait(self):
+        return self.wait_time
+
+
+class AnonBucketThrottle(TokenBucketThrottle):
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {
+            'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class UserBucketThrottle(TokenBucketThrottle):
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return None
+        return self.cache_format % {
+            'scope': self.scope, 'ident': request.user.pk}
+
+
+class ScopedBucketThrottle(TokenBucketThrottle):
+    """
+    Лимиты отдельных операций: throttle_scopes view ({action: scope})
+    и scope 'writes' для всех изменяющих запросов.
+    """
+
+    def __init__(self):
+        pass  # Ставка зависит от view, определяется в allow_request
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scopes', {}).get(
+            getattr(view, 'action', None))
+        if self.scope is None and request.method not in SAFE_METHODS:
+            self.scope = 'writes'
+        if self.scope is None:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        ident = (request.user.pk if request.user
+                 and request.user.is_authenticated
+                 else self.get_ident(request))
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
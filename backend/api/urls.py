@@ -1,6 +1,8 @@
-from django.urls import include, path
+from django.conf import settings
+from django.urls import URLPattern, include, path
 from rest_framework.routers import SimpleRouter
 
+from .async_views import async_view
 from .views import (IngredientViewSet, RecipeViewSet, SubscriptionViewSet,
                     TagViewSet, UsersViewSet)
 
@@ -16,7 +18,22 @@ router.register('users/subscriptions',
                 basename='subscriptions')
 router.register('users', UsersViewSet, basename='users')
 
+# Нагруженные чтением эндпоинты в режиме ASGI (ASYNC_VIEWS=True)
+ASYNC_URL_NAMES = ('recipes-list', 'recipes-detail', 'ingredients-list',
+                   'ingredients-detail', 'subscriptions-list')
+
+
+def get_router_urls():
+    if not settings.ASYNC_VIEWS:
+        return router.urls
+    return [
+        URLPattern(url.pattern, async_view(url.callback), url.default_args,
+                   url.name) if url.name in ASYNC_URL_NAMES else url
+        for url in router.urls
+    ]
+
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(get_router_urls())),
     path('auth/', include('djoser.urls.authtoken')),
 ]
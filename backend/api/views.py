@@ -1,31 +1,102 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F
+from django.http import (Http404, HttpResponse, HttpResponseRedirect,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from . import metrics, response_cache
+from .constants import SHOPPING_CART_CHUNK_SIZE
 from .filters import IngredientSearchFilter, RecipesFilter
 from .models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCart,
-                     Subscription, Tag)
+                     ShoppingCartTotal, Subscription, Tag)
+from .pagination import RecipePagination
 from .permissions import IsAuthorOrAuthOrReadOnlyPermission
-from .serializers import (FullRecipeSerializer, FullUserSerializer,
-                          IngredientSerializer, RecipeMinifiedSerializer,
-                          ShoppingCartSerializer, SubscribeSerializer,
+from .reference_cache import ingredients_cache, tags_cache
+from .serializers import (CachedRecipeSerializer, FullRecipeSerializer,
+                          FullUserSerializer, IngredientSerializer,
+                          RecipeMinifiedSerializer, ShoppingCartSerializer,
+                          SubscribeSerializer,
                           SubscriptionWithRecipesSerializer, TagSerializer,
                           UserAvatarSerializer, WriteRecipeSerializer)
+from .shopping_list import FORMATS, ShoppingListNegotiation
+from .short_links import decode, encode
 
 User = get_user_model()
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+def shopping_cart_etag(request):
+    """ETag списка покупок: меняется вместе с корзиной и форматом."""
+    changed = request.user.shopping_cart_changed
+    version = changed.timestamp() if changed else 0
+    file_format = request.query_params.get('format', 'txt')
+    return f'{request.user.id}-{version}-{file_format}'
+
+
+def shopping_cart_modified(request):
+    return request.user.shopping_cart_changed
+
+
+def short_link_redirect(request, code):
+    """Переход по короткой ссылке на страницу рецепта без запросов к БД."""
+    recipe_id = decode(code)
+    if recipe_id is None:
+        raise Http404
+    return HttpResponseRedirect(f'/recipes/{recipe_id}')
+
+
+def metrics_export(request):
+    """
+    Метрики всех воркеров для Prometheus. Через nginx не доступны,
+    собираются напрямую с backend:8000.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ReferenceCacheMixin:
+    """Список и объекты справочника отдаются из снимка в памяти процесса."""
+
+    reference_cache = None
+
+    def use_reference_cache(self, request):
+        return True
+
+    def cached_response(self, request, content, etag):
+        response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return get_conditional_response(request, etag=etag, response=response)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_reference_cache(request):
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(request, *self.reference_cache.get().list)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            item = self.reference_cache.get().items[int(kwargs['pk'])]
+        except (KeyError, ValueError):
+            raise NotFound()
+        return self.cached_response(request, *item)
+
+
+class IngredientViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     Получаем список всех ИНГРЕДИЕНТОВ.
     Получаем конкретный ИНГРЕДИЕНТ по его id.
@@ -37,9 +108,14 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientSearchFilter
+    reference_cache = ingredients_cache
+    throttle_scopes = {'list': 'search'}
+
+    def use_reference_cache(self, request):
+        return not request.query_params.get('name')  # Поиск идёт мимо снимка
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     Получаем список всех ТЕГОВ.
     Получаем конкретный ТЕГ по его id.
@@ -49,6 +125,7 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
     pagination_class = None
+    reference_cache = tags_cache
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -62,28 +139,81 @@ class RecipeViewSet(viewsets.ModelViewSet):
     """
 
     queryset = Recipe.objects.all()
-    pagination_class = LimitOffsetPagination
+    pagination_class = RecipePagination
     permission_classes = (IsAuthorOrAuthOrReadOnlyPermission,)
     http_method_names = ('get', 'post', 'patch', 'delete',)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipesFilter
+    throttle_scopes = {'download_shopping_cart': 'downloads'}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('retrieve', 'list'):
+            if self.use_fragments(self.request):
+                # Остальное CachedRecipeSerializer возьмёт из кэша
+                return queryset.only('author', 'pub_date')
+            # Число запросов на страницу не зависит от limit
+            queryset = queryset.with_related().with_user_flags(
+                self.request.user)
+        return queryset
 
     def get_serializer_class(self, action=None):
         if (action or self.action) in ('retrieve', 'list'):
+            if self.use_fragments(self.request):
+                return CachedRecipeSerializer
             return FullRecipeSerializer
         return WriteRecipeSerializer
 
+    def use_fragments(self, request):
+        return isinstance(
+            getattr(request, 'accepted_renderer', None), JSONRenderer)
+
+    def use_response_cache(self, request):
+        """Кэшируем JSON для анонимов: флаги у них всегда False."""
+        return (not request.user.is_authenticated
+                and isinstance(request.accepted_renderer, JSONRenderer)
+                and 'ordering' not in request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_response_cache(request):
+            return super().list(request, *args, **kwargs)
+        key = response_cache.make_key('list', request)
+        content = response_cache.get_cached(key)
+        if content is None:
+            author = request.query_params.get('author')
+            versions = response_cache.get_versions((
+                response_cache.REFERENCE,
+                response_cache.author_tag(author) if author
+                else response_cache.FEED))
+            content = JSONRenderer().render(
+                super().list(request, *args, **kwargs).data)
+            response_cache.store(key, content, versions)
+        return HttpResponse(content, content_type='application/json')
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_response_cache(request):
+            return super().retrieve(request, *args, **kwargs)
+        key = response_cache.make_key(f'detail:{kwargs["pk"]}', request)
+        content = response_cache.get_cached(key)
+        if content is None:
+            instance = self.get_object()
+            versions = response_cache.get_versions((
+                response_cache.REFERENCE,
+                response_cache.recipe_tag(instance.id),
+                response_cache.author_tag(instance.author_id)))
+            content = JSONRenderer().render(
+                self.get_serializer(instance).data)
+            response_cache.store(key, content, versions)
+        return HttpResponse(content, content_type='application/json')
+
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_short_link(self, request, pk=None):
         """Получаем короткую ссылку на РЕЦЕПТ по его id."""
-        try:
-            recipe = self.get_object()  # Получаем рецепт по id
-            # Генерируем короткую ссылку
-            short_link = f"{settings.BASE_URL}/api/recipes/{recipe.id}"
-            return Response({"short-link": short_link},
-                            status=status.HTTP_200_OK)
-        except Recipe.DoesNotExist:
-            raise NotFound("Объект не найден")
+        recipe = self.get_object()
+        code = recipe.short_code or encode(recipe.pk)  # До backfill
+        return Response(
+            {"short-link": f"{settings.BASE_URL}/s/{code}"},
+            status=status.HTTP_200_OK)
 
     def base_manage_user_and_recipe_method(
             self, request, pk=None, model=None, serializer_class=None):
@@ -95,13 +225,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 return Response(  # Проверяем, существует ли уже запись
                     {"detail": "Рецепт уже добавлен."},
                     status=status.HTTP_400_BAD_REQUEST)
-            model.objects.create(user=user, recipe=recipe)
+            with transaction.atomic():  # Вместе со счётчиками из сигналов
+                model.objects.create(user=user, recipe=recipe)
             response_data = RecipeMinifiedSerializer(recipe).data
             return Response(response_data, status=status.HTTP_201_CREATED)
         elif request.method == 'DELETE':
             try:
-                item = model.objects.get(user=user, recipe=recipe)
-                item.delete()
+                model.objects.get(user=user, recipe=recipe).delete()
                 return Response(status=status.HTTP_204_NO_CONTENT)
             except model.DoesNotExist:
                 return Response(
@@ -120,42 +250,40 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.base_manage_user_and_recipe_method(
             request, pk, FavoriteRecipe, None)
 
-    @action(detail=False, methods=['get'], url_path='download_shopping_cart')
+    @action(detail=False, methods=['get'], url_path='download_shopping_cart',
+            permission_classes=(IsAuthenticated,),
+            content_negotiation_class=ShoppingListNegotiation)
+    @method_decorator(condition(etag_func=shopping_cart_etag,
+                                last_modified_func=shopping_cart_modified))
     def download_shopping_cart(self, request):
-        """Получаем файл со списком покупок в текстовом формате."""
-        shopping_cart = self.get_shopping_cart(request.user)
-        # Создание HTTP-ответа с типом контента текстового файла
-        response = HttpResponse(content_type='text/plain')
+        """Получаем файл со списком покупок (txt, csv или pdf)."""
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in FORMATS:
+            raise ValidationError(
+                {'format': f'Доступные форматы: {", ".join(FORMATS)}.'})
+        content_type, extension, render = FORMATS[file_format]
+        # Под ASGI Django перебирает StreamingHttpResponse в цикле событий,
+        # где ORM недоступен: там файл целиком собирается здесь, в потоке
+        response_class = (HttpResponse if settings.ASYNC_VIEWS
+                          else StreamingHttpResponse)
+        response = response_class(
+            render(self.get_shopping_cart(request.user)),
+            content_type=content_type)
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.txt"')
-        name_width = 35  # Ширина для названия
-        quantity_width = 10  # Ширина для количества
-        lines = [  # Запись данных в текстовый файл
-            "          <<<СПИСОК ПОКУПОК>>>\n",
-            "НАЗВАНИЕ".ljust(name_width) + "КОЛИЧЕСТВО\n"]
-        for item in shopping_cart:
-            # Форматируем строки с выравниванием
-            lines.append(
-                f"{item['name'].ljust(name_width)}"
-                f"{str(item['quantity']).ljust(quantity_width)}\n"
-            )
-        response.writelines(lines)  # Запись всех строк в ответ
+            f'attachment; filename="shopping_cart.{extension}"')
         return response
 
     def get_shopping_cart(self, user):
-        """Формируем список покупок."""
-        shopping_cart_items = (  # Получаем все ингредиенты и их количества
-            ShoppingCart.objects
+        """Формируем список покупок из готовых итогов пользователя."""
+        return (
+            ShoppingCartTotal.objects
             .filter(user=user)
-            .values('recipe__recipe_ingredients__ingredient__name')
-            .annotate(total_quantity=Sum('recipe__recipe_ingredients__amount'))
+            .values('amount',
+                    name=F('ingredient__name'),
+                    measurement_unit=F('ingredient__measurement_unit'))
+            .order_by('name', 'measurement_unit')
+            .iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)
         )
-        shopping_cart = [  # Формируем список покупок
-            {'name': item['recipe__recipe_ingredients__ingredient__name'],
-             'quantity': item['total_quantity']}
-            for item in shopping_cart_items
-        ]
-        return shopping_cart
 
 
 class SubscriptionViewSet(viewsets.GenericViewSet):
@@ -170,27 +298,17 @@ class SubscriptionViewSet(viewsets.GenericViewSet):
     filterset_class = RecipesFilter
 
     def get_queryset(self):
-        return User.objects.filter(subscribers__user=self.request.user)
+        return SubscriptionWithRecipesSerializer.with_recipes(
+            User.objects.filter(subscribers__user=self.request.user),
+            SubscriptionWithRecipesSerializer.get_recipes_limit(self.request))
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
         page = self.paginate_queryset(queryset)  # Применяем пагинацию
-        # Получаем рецепты для всех пользователей
-        recipes = Recipe.objects.filter(author__in=queryset)
         if page is not None:
-            serializer = self.get_serializer(
-                page,
-                many=True,
-                context={'recipes': recipes,
-                         'recipes_limit': request.query_params.get(
-                             'recipes_limit')})
+            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(
-            queryset,
-            many=True,
-            context={'recipes': recipes,
-                     'recipes_limit': request.query_params.get(
-                         'recipes_limit')})
+        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
 
@@ -245,23 +363,22 @@ class UsersViewSet(UserViewSet):
             serializer = SubscribeSerializer(
                 data={'author_id': author.id}, context={'request': request})
             serializer.is_valid(raise_exception=True)
-            Subscription.objects.get_or_create(
-                user=request.user, author=author)
-            recipes = author.recipes.all()  # Получаем рецепты
-            recipes_limit = request.query_params.get('recipes_limit', None)
+            # Проверяем до подписки: ошибка не должна оставить её созданной
+            recipes_limit = (
+                SubscriptionWithRecipesSerializer.get_recipes_limit(request))
+            with transaction.atomic():
+                Subscription.objects.get_or_create(
+                    user=request.user, author=author)
+            author = SubscriptionWithRecipesSerializer.with_recipes(
+                User.objects.filter(id=author.id), recipes_limit).get()
             user_serializer = SubscriptionWithRecipesSerializer(
-                author, context={
-                    'request': request,
-                    'recipes': recipes,
-                    'recipes_limit': recipes_limit  # Передаем лимит также
-                })
+                author, context={'request': request})
             return Response(
                 user_serializer.data, status=status.HTTP_201_CREATED)
         elif request.method == 'DELETE':
             try:
-                subscription = Subscription.objects.get(
-                    user=request.user, author=author)
-                subscription.delete()
+                Subscription.objects.get(
+                    user=request.user, author=author).delete()
                 return Response(status=status.HTTP_204_NO_CONTENT)
             except Subscription.DoesNotExist:
                 return Response(
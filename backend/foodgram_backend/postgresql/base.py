@@ -0,0 +1,119 @@
+"""
+Бэкенд PostgreSQL с проверкой постоянных соединений (CONN_HEALTH_CHECKS,
+как в Django 4.1) и необязательным пулом соединений процесса
+(OPTIONS['pool'] = {'max_size': ..., 'timeout': ...}).
+"""
+from functools import partial
+from threading import BoundedSemaphore, Lock
+
+from django.db.backends.postgresql import base
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+
+def is_usable(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except base.Database.Error:
+        return False
+    return True
+
+
+class ConnectionPool:
+    """Не больше max_size соединений; ждём свободное не дольше timeout."""
+
+    def __init__(self, max_size, timeout=30):
+        self.idle = []
+        self.lock = Lock()
+        self.slots = BoundedSemaphore(max_size)
+        self.timeout = timeout
+
+    def get(self, connect):
+        """Соединение и признак того, что оно уже использовалось."""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise base.Database.OperationalError(
+                'Database connection pool exhausted.')
+        with self.lock:
+            connection = self.idle.pop() if self.idle else None
+        if connection is not None and not connection.closed:
+            return connection, True
+        try:
+            return connect(), False
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def put(self, connection, discard=False):
+        try:
+            if not discard and not connection.closed:
+                if (connection.info.transaction_status
+                        != TRANSACTION_STATUS_IDLE):
+                    connection.rollback()
+                with self.lock:
+                    self.idle.append(connection)
+                return
+            connection.close()
+        finally:
+            self.slots.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pools = {}  # Параметры подключения -> пул, один на процесс
+    pools_lock = Lock()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict['OPTIONS'].get('pool')
+        if not options:
+            return None
+        # Тестовая БД и служебная БД postgres получают отдельные пулы
+        key = tuple(sorted(conn_params.items()))
+        with self.pools_lock:
+            if key not in self.pools:
+                self.pools[key] = ConnectionPool(**options)
+            return self.pools[key]
+
+    def get_new_connection(self, conn_params):
+        self.health_check_done = True  # Свежее соединение не проверяем
+        self.pool = self.get_pool(conn_params)
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+        connect = partial(super().get_new_connection, conn_params)
+        connection, reused = self.pool.get(connect)
+        if reused and self.health_check_enabled and not is_usable(
+                connection):
+            self.pool.put(connection, discard=True)
+            connection, _ = self.pool.get(connect)
+        return connection
+
+    def _close(self):
+        if self.connection is None or getattr(self, 'pool', None) is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            self.pool.put(self.connection, discard=self.errors_occurred)
+
+    def ensure_connection(self):
+        # Постоянное соединение проверяем один раз за запрос до первого
+        # обращения: оборванное соединение не превратится в ошибку 500
+        if (self.connection is not None and self.health_check_enabled
+                and not self.health_check_done and not self.in_atomic_block):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
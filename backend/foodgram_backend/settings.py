@@ -14,6 +14,9 @@ DEBUG = os.getenv("PRODUCTION_MODE") == "False"
 
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost').split(',')
 
+# Адрес сайта для коротких ссылок на рецепты
+BASE_URL = os.getenv('BASE_URL', 'http://localhost')
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -31,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.performance.ServerTimingMiddleware',  # Первым: замер всего запроса
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -65,18 +69,86 @@ WSGI_APPLICATION = 'foodgram_backend.wsgi.application'
 AUTH_USER_MODEL = 'users.UserProfile'  # Profile user model
 
 
+# Пул соединений процесса (DB_POOL=True): общий лимит DB_MAX_CONNECTIONS
+# делится между воркерами gunicorn. Без пула соединения постоянные
+DB_POOL = os.getenv('DB_POOL') == 'True'
+DB_POOL_SIZE = max(1, int(os.getenv('DB_MAX_CONNECTIONS', 20))
+                   // int(os.getenv('GUNICORN_WORKERS', 1)))
+
 DATABASES = {
     'default': {
         # Меняем настройку Django: теперь для работы будет использоваться
-        # бэкенд postgresql
-        'ENGINE': 'django.db.backends.postgresql',
+        # бэкенд postgresql (с проверкой соединений и пулом)
+        'ENGINE': 'foodgram_backend.postgresql',
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # С пулом соединение возвращается в пул в конце каждого запроса
+        'CONN_MAX_AGE': 0 if DB_POOL else int(
+            os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS') != 'False',
+        'OPTIONS': {'pool': {
+            'max_size': DB_POOL_SIZE,
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        }} if DB_POOL else {},
+    }
+}
+
+
+# Общий для воркеров кэш: версии справочников, кэши ответов и фрагментов,
+# снимки токенов, лимиты запросов. В docker-compose — memcached
+# (CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache,
+# CACHE_LOCATION=memcached:11211). Файловый кэш по умолчанию — для
+# разработки: сверх CACHE_MAX_ENTRIES он удаляет треть записей подряд
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', '/tmp/foodgram_cache'),
     }
 }
+if 'memcached' not in CACHE_BACKEND:  # Клиенту memcached не передаются
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+    }
+
+# Время жизни кэша ответов для анонимных запросов к рецептам (секунды)
+RECIPE_RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_RESPONSE_CACHE_TIMEOUT', 600))
+
+# Уменьшенные копии картинок готовятся в фоновых потоках после ответа;
+# IMAGE_PROCESSING_ASYNC=False обрабатывает их сразу (тесты, отладка)
+IMAGE_PROCESSING_ASYNC = os.getenv('IMAGE_PROCESSING_ASYNC') != 'False'
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+# ASGI (uvicorn): async-view для чтения рецептов, подписок и ингредиентов,
+# ORM в них выполняется в пуле из ASYNC_DB_THREADS потоков на воркер
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == 'True'
+ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', 8))
+
+# Время жизни снимка пользователя для аутентификации по токену (секунды)
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 300))
+
+# Доля запросов с заголовком Server-Timing (0 — замеры выключены);
+# запросы сверх бюджетов (число SQL, мс) пишутся в лог api.performance
+SERVER_TIMING_SAMPLE_RATE = float(
+    os.getenv('SERVER_TIMING_SAMPLE_RATE', 1 if DEBUG else 0.05))
+PERFORMANCE_QUERY_BUDGET = int(os.getenv('PERFORMANCE_QUERY_BUDGET', 20))
+PERFORMANCE_TIME_BUDGET = int(os.getenv('PERFORMANCE_TIME_BUDGET', 500))
+
+# Метрики Prometheus на /metrics (METRICS_ENABLED=True): воркеры пишут
+# свои значения в METRICS_DIR не чаще раза в METRICS_FLUSH_INTERVAL секунд,
+# /metrics их суммирует
+METRICS_ENABLED = os.getenv('METRICS_ENABLED') == 'True'
+METRICS_DIR = os.getenv('METRICS_DIR', '/tmp/foodgram_metrics')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))
+
+# Лимиты запросов DEFAULT_THROTTLE_RATES; THROTTLING_ENABLED=False снимает
+# их для нагрузочных прогонов (load_test делает это сам)
+THROTTLING_ENABLED = os.getenv('THROTTLING_ENABLED') != 'False'
 
 
 # Password validation
@@ -123,14 +195,22 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated', 
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.AnonBucketThrottle',
+        'api.throttling.UserBucketThrottle',
+        'api.throttling.ScopedBucketThrottle',
+    ],
     'DEFAULT_THROTTLE_RATES': {
-        'user': '10000/day', #  Лимит для UserRateThrottle
-        'anon': '1000/day',  #  Лимит для AnonRateThrottle
+        'user': '10000/day', #  Лимит для UserBucketThrottle
+        'anon': '1000/day',  #  Лимит для AnonBucketThrottle
+        'search': '120/minute',  # Поиск ингредиентов (автодополнение)
+        'writes': '60/minute',  # Изменяющие запросы
+        'downloads': '10/minute',  # Выгрузка списка покупок
     },    
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
@@ -152,4 +232,9 @@ DJOSER = {
         "user_list": ["rest_framework.permissions.AllowAny"],  # Разрешаем обзор к пользователям всем
         "current_user": ["rest_framework.permissions.IsAuthenticated"]
     },
-}
\ No newline at end of file
+}
+
+
+# Шрифт с кириллицей для выгрузки списка покупок в PDF
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
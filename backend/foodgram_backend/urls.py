@@ -14,6 +14,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from api.views import metrics_export, short_link_redirect
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
@@ -23,6 +24,8 @@ from django.views.generic import TemplateView
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('s/<str:code>', short_link_redirect, name='short-link'),
+    path('metrics', metrics_export, name='metrics'),
     path('redoc/',
          TemplateView.as_view(template_name='redoc.html'),
          name='redoc'),
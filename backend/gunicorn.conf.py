@@ -0,0 +1,18 @@
+import os
+import shutil
+
+bind = '0.0.0.0:8000'
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+
+if os.getenv('ASYNC_VIEWS') == 'True':
+    # Uvicorn-воркеры с async-view, см. ASYNC_VIEWS в settings.py
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'foodgram_backend.asgi:application'
+else:
+    wsgi_app = 'foodgram_backend.wsgi:application'
+
+
+def on_starting(server):
+    """Метрики прошлого запуска не суммируются с новыми (METRICS_DIR)."""
+    shutil.rmtree(os.getenv('METRICS_DIR', '/tmp/foodgram_metrics'),
+                  ignore_errors=True)
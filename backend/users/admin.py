@@ -30,14 +30,16 @@ class UserProfileAdmin(admin.ModelAdmin):
 class IngredientRecipeInlineFormset(forms.BaseInlineFormSet):
     def clean(self):
         super().clean()
+        ingredients = [
+            form.cleaned_data['ingredient'] for form in self.forms
+            if form.cleaned_data.get('ingredient')
+            and not form.cleaned_data.get('DELETE')]
         # Eсть ли хотя бы один ингредиент, который не помечен для удаления?
-        if not any(
-            form.cleaned_data.get('ingredient')
-            and not form.cleaned_data.get('DELETE')
-            for form in self.forms
-        ):
+        if not ingredients:
             raise ValidationError(
                 "Пожалуйста, добавьте хотя бы один ингредиент.")
+        if len(set(ingredients)) != len(ingredients):
+            raise ValidationError("Ингредиенты не должны повторяться.")
 
 
 class IngredientInline(admin.StackedInline):
@@ -64,7 +66,8 @@ class RecipeAdmin(admin.ModelAdmin):
                 f'<img src="{obj.image.url}" width="50" height="60" />')
         return None
 
-    @admin.display(description='Число добавлений в избранное')
+    @admin.display(description='Число добавлений в избранное',
+                   ordering='favorites_count')
     def in_favourite_count(self, obj):
         """Возвращает количество добавлений рецепта в избранное."""
         return obj.favorite_count()
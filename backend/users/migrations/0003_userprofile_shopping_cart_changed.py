@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-17 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20250115_1842'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='shopping_cart_changed',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Изменение списка покупок'),
+        ),
+    ]
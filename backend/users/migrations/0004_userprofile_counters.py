@@ -0,0 +1,23 @@
+# Generated by Django 3.2.3 on 2026-10-17 03:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_userprofile_shopping_cart_changed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число рецептов'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число подписчиков'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-17 03:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_userprofile_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='is_subscribed',
+        ),
+    ]
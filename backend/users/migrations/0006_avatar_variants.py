@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-17 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_remove_userprofile_is_subscribed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_variants',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Уменьшенные копии аватара'),
+        ),
+    ]
@@ -5,7 +5,28 @@ from django.db import models
 from .constants import EMAIL_MAX_LENGTH, NAMES_FIELD_MAX_LENGTH
 
 
-class UserProfile(AbstractUser):
+class UpdateManagedFieldsMixin:
+    """
+    Поля update_managed_fields меняются только через update() (счётчики
+    с F()): save() существующей записи их не перезаписывает значениями,
+    прочитанными раньше.
+    """
+
+    update_managed_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+                and field.name not in self.update_managed_fields]
+        return super().save(*args, **kwargs)
+
+
+class UserProfile(UpdateManagedFieldsMixin, AbstractUser):
     """
     Profile user model.
     Users within the project authentication system are represented by this
@@ -32,12 +53,26 @@ class UserProfile(AbstractUser):
     avatar = models.ImageField(
         'Аватар', upload_to='users/', blank=True, null=True
     )
-    is_subscribed = models.BooleanField('Подписан ли', default=False)
+    avatar_variants = models.JSONField(
+        'Уменьшенные копии аватара', default=dict, editable=False
+    )
+    shopping_cart_changed = models.DateTimeField(
+        'Изменение списка покупок', blank=True, null=True, editable=False
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов', default=0, editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0, editable=False
+    )
 
     class Meta:
         ordering = ('username',)
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
 
+    update_managed_fields = ('shopping_cart_changed', 'recipes_count',
+                             'subscribers_count')
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')